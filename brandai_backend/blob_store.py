@@ -0,0 +1,151 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+# How often put() sweeps out blobs past their retention.
+PURGE_INTERVAL_SECONDS = 3600
+
+
+class BlobStore:
+    """
+    Content-addressed blob storage interface. Blobs are identified by the
+    SHA-256 hex digest of their bytes, so identical content is stored once.
+    """
+
+    def put(self, data: bytes, content_type: str, digest: Optional[str] = None) -> str:
+        """Stores data (if not already present) and returns its digest."""
+        raise NotImplementedError
+
+    def metadata(self, digest: str) -> Optional[dict]:
+        """Returns {"content_type", "size", "created_at"} or None if the blob does not exist."""
+        raise NotImplementedError
+
+    def iter_chunks(self, digest: str, chunk_size: int = 64 * 1024):
+        """Yields the blob's bytes in chunks."""
+        raise NotImplementedError
+
+    def delete(self, digest: str):
+        raise NotImplementedError
+
+    def purge(self, stored_before: float) -> int:
+        """Deletes blobs last stored before the given timestamp. Returns the number deleted."""
+        raise NotImplementedError
+
+
+class LocalBlobStore(BlobStore):
+    """
+    Blob store on the local filesystem, sharded by the first two digest characters:
+    <root>/ab/abcdef....bin with a sidecar <digest>.json holding the metadata.
+    Blobs are deleted retention_seconds after they were last stored (0 keeps them
+    forever); storing an existing blob again restarts its retention.
+    """
+
+    def __init__(self, root: str, retention_seconds: int = 0):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.retention_seconds = retention_seconds
+        self._last_purge = 0.0
+        self._purge_lock = threading.Lock()
+
+    def _paths(self, digest: str) -> tuple:
+        if len(digest) != 64 or any(c not in "0123456789abcdef" for c in digest):
+            raise ValueError(f"Invalid blob digest: {digest!r}")
+        shard = self.root / digest[:2]
+        return shard / f"{digest}.bin", shard / f"{digest}.json"
+
+    def _write_atomic(self, path: Path, data: bytes):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+    def put(self, data: bytes, content_type: str, digest: Optional[str] = None) -> str:
+        digest = digest or hashlib.sha256(data).hexdigest()
+        blob_path, meta_path = self._paths(digest)
+        now = time.time()
+        meta = self.metadata(digest)
+        if meta is None:
+            self._write_atomic(blob_path, data)
+            meta = {"content_type": content_type, "size": len(data), "created_at": now}
+            self._write_atomic(meta_path, json.dumps(meta).encode("utf-8"))
+        elif self.retention_seconds and now - meta["created_at"] > self.retention_seconds / 2:
+            # Still in use: restart its retention so a freshly returned URL does not expire soon.
+            self._write_atomic(meta_path, json.dumps(dict(meta, created_at=now)).encode("utf-8"))
+        if self.retention_seconds and now - self._last_purge >= PURGE_INTERVAL_SECONDS:
+            self._last_purge = now
+            self.purge(now - self.retention_seconds)
+        return digest
+
+    def metadata(self, digest: str) -> Optional[dict]:
+        try:
+            _, meta_path = self._paths(digest)
+            with open(meta_path, "r") as f:
+                return json.load(f)
+        except (ValueError, FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def iter_chunks(self, digest: str, chunk_size: int = 64 * 1024):
+        blob_path, _ = self._paths(digest)
+        with open(blob_path, "rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def delete(self, digest: str):
+        for path in self._paths(digest):
+            path.unlink(missing_ok=True)
+
+    def purge(self, stored_before: float) -> int:
+        """
+        Deletes blobs whose sidecar created_at is older than stored_before, and blob files
+        left without a sidecar by an interrupted put(). Concurrent purges are skipped.
+        """
+        if not self._purge_lock.acquire(blocking=False):
+            return 0
+        deleted = 0
+        try:
+            for blob_path in self.root.glob("??/*.bin"):
+                digest = blob_path.stem
+                try:
+                    meta = self.metadata(digest)
+                    stored_at = meta["created_at"] if meta is not None else blob_path.stat().st_mtime
+                    if stored_at < stored_before:
+                        self.delete(digest)
+                        deleted += 1
+                except (ValueError, OSError):
+                    continue
+        finally:
+            self._purge_lock.release()
+        if deleted:
+            print(f"🧹 Purged {deleted} expired blobs")
+        return deleted
+
+
+# Available blob store backends, selected by BLOB_STORE_BACKEND.
+BLOB_STORE_BACKENDS = {
+    "local": LocalBlobStore,
+}
+
+
+def create_blob_store(backend: str, location: str, retention_seconds: int = 0) -> BlobStore:
+    """
+    Instantiates the named blob store backend at location (a directory for "local"),
+    deleting blobs retention_seconds after they were last stored (0 keeps them).
+    """
+    try:
+        backend_class = BLOB_STORE_BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f"Unknown blob store backend '{backend}'. Available: {list(BLOB_STORE_BACKENDS)}")
+    return backend_class(location, retention_seconds=retention_seconds)
@@ -0,0 +1,175 @@
+import re
+from collections import deque
+from typing import Optional
+
+_NON_ALPHANUMERIC = re.compile(r"[^a-z0-9]+")
+
+# Match scores for an alias that equals, or appears inside, the logo description.
+EXACT_MATCH_SCORE = 1.0
+CONTAINED_MATCH_SCORE = 0.9
+# Fuzzy (trigram) matches below this score are not reported as candidates.
+DEFAULT_MIN_MATCH_SCORE = 0.6
+
+
+def normalize_text(text: str) -> str:
+    """Lowercases text and collapses every run of non-alphanumerics into a single space."""
+    return _NON_ALPHANUMERIC.sub(" ", (text or "").lower()).strip()
+
+
+def compact_text(text: str) -> str:
+    """Normalized text with all separators removed, e.g. "The Coca-Cola Co." -> "thecocacolaco"."""
+    return normalize_text(text).replace(" ", "")
+
+
+class AhoCorasickMatcher:
+    """
+    Multi-pattern substring matcher. Finds every pattern occurring in a text in a
+    single pass over the text, independent of the number of patterns.
+    """
+
+    def __init__(self, patterns: dict):
+        """patterns maps each pattern string to the set of values it should report."""
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [set()]
+        for pattern, values in patterns.items():
+            state = 0
+            for char in pattern:
+                if char not in self._goto[state]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(set())
+                    self._goto[state][char] = len(self._goto) - 1
+                state = self._goto[state][char]
+            self._output[state] |= set(values)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                self._output[next_state] |= self._output[self._fail[next_state]]
+
+    def finditer(self, text: str):
+        """Yields (end_index, value) for every pattern occurrence, end_index being exclusive."""
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for value in self._output[state]:
+                yield index + 1, value
+
+    def search(self, text: str) -> set:
+        """Returns the union of values for every pattern found in text."""
+        return {value for _, value in self.finditer(text)}
+
+
+def trigrams(text: str) -> set:
+    """Character trigrams of a compact string, padded so short strings still produce some."""
+    padded = f"${text}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def kit_aliases(key: str, brand_kit: dict) -> list:
+    """The compact aliases a brand kit is known by: its key, brand name and any "aliases" entries."""
+    names = [key, brand_kit.get("brand_name", ""), *brand_kit.get("aliases", [])]
+    return sorted({compact_text(name) for name in names} - {""})
+
+
+class BrandIndex:
+    """
+    Precomputed lookup from detected logo descriptions to brand kit keys.
+
+    Every kit contributes an alias table (key, brand name and its "aliases" list),
+    normalized to compact form. A description is scored against the aliases in
+    three ways, keeping each brand's best score:
+
+    - exact: the compact description equals an alias (EXACT_MATCH_SCORE)
+    - contained: an alias spans whole words of the description, found with a single
+      Aho-Corasick pass (CONTAINED_MATCH_SCORE), e.g. "The Coca-Cola Company";
+      "Pineapple" does not contain "apple" in this sense
+    - fuzzy: Dice similarity of character trigrams, with candidates drawn from a
+      trigram inverted index so only aliases sharing a trigram are compared
+
+    Candidates below min_score are dropped.
+    """
+
+    def __init__(self, brand_kits: dict, min_score: float = DEFAULT_MIN_MATCH_SCORE):
+        self.min_score = min_score
+        self._order = {key: position for position, key in enumerate(brand_kits)}
+        self.aliases = {key: kit_aliases(key, kit) for key, kit in brand_kits.items()}
+
+        patterns = {}
+        self._alias_trigrams = {}
+        self._trigram_index = {}
+        for key, aliases in self.aliases.items():
+            for alias in aliases:
+                patterns.setdefault(alias, set()).add(key)
+                alias_trigrams = trigrams(alias)
+                self._alias_trigrams[alias] = alias_trigrams
+                for trigram in alias_trigrams:
+                    self._trigram_index.setdefault(trigram, set()).add(alias)
+        self._alias_keys = patterns
+        self._matcher = AhoCorasickMatcher({alias: {alias} for alias in patterns})
+
+    def match(self, description: str) -> list:
+        """
+        Scores every brand the description could refer to. Returns a list of
+        {"brand_key", "alias", "score"} sorted best first, ties in brand kit file order.
+        """
+        words = normalize_text(description).split()
+        compact = "".join(words)
+        if not compact:
+            return []
+
+        boundaries = {0}
+        for word in words:
+            boundaries.add(max(boundaries) + len(word))
+        alias_scores = {
+            alias: CONTAINED_MATCH_SCORE
+            for end, alias in self._matcher.finditer(compact)
+            if end in boundaries and end - len(alias) in boundaries
+        }
+        if compact in self._alias_keys:
+            alias_scores[compact] = EXACT_MATCH_SCORE
+
+        description_trigrams = trigrams(compact)
+        shared_counts = {}
+        for trigram in description_trigrams:
+            for alias in self._trigram_index.get(trigram, ()):
+                shared_counts[alias] = shared_counts.get(alias, 0) + 1
+        for alias, shared in shared_counts.items():
+            similarity = 2 * shared / (len(description_trigrams) + len(self._alias_trigrams[alias]))
+            alias_scores[alias] = max(alias_scores.get(alias, 0.0), similarity)
+
+        best = {}
+        for alias, score in alias_scores.items():
+            if score < self.min_score:
+                continue
+            for key in self._alias_keys[alias]:
+                if key not in best or score > best[key]["score"]:
+                    best[key] = {"brand_key": key, "alias": alias, "score": round(score, 3)}
+        return sorted(best.values(), key=lambda candidate: (-candidate["score"], self._order[candidate["brand_key"]]))
+
+    def rank(self, logos: list) -> list:
+        """
+        Ranks brand candidates across detected logos ({"description", "score"} dicts as
+        returned by Vision). Candidates are ordered by match score, then by the Vision
+        logo score, so two equally good matches go to the more confidently detected logo.
+        """
+        candidates = []
+        for logo in logos:
+            for candidate in self.match(logo.get("description", "")):
+                candidates.append(dict(candidate, logo_description=logo.get("description"), logo_score=logo.get("score") or 0.0))
+        candidates.sort(key=lambda candidate: (-candidate["score"], -candidate["logo_score"], self._order[candidate["brand_key"]]))
+        return candidates
+
+    def resolve(self, description: str) -> Optional[str]:
+        """Returns the best matching brand key for a logo description, or None if no brand matches."""
+        candidates = self.match(description)
+        return candidates[0]["brand_key"] if candidates else None
@@ -0,0 +1,321 @@
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Optional
+
+from brand_index import kit_aliases
+from result_cache import LRUCache
+
+# How long a replaced kit version stays readable, for snapshots still in use by in-flight requests.
+SUPERSEDED_VERSION_RETENTION_SECONDS = 3600
+
+
+def brand_kit_hash(brand_kit: dict) -> str:
+    """Content hash of a brand kit, used to invalidate cached evaluations when the kit changes."""
+    return hashlib.sha256(json.dumps(brand_kit, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def write_json_atomic(path: Path, data):
+    """
+    Writes data as JSON to a temp file next to path, then renames it over path. The temp
+    file is a dotfile without a .json suffix, so watchers never load a half-written kit.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-", suffix=".partial")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, indent=2)
+            f.write("\n")
+        os.replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+
+
+class BrandKitRepository:
+    """
+    Source of brand kits for the BrandKitStore. load() returns everything a snapshot
+    needs: the kits as a mapping (which may load kits lazily), the fields the brand
+    index is built from ({key: {"brand_name", "aliases"}}) and per-kit content hashes.
+    """
+
+    def fingerprint(self):
+        """A cheap change token; load() is only called again once it differs."""
+        raise NotImplementedError
+
+    def load(self) -> tuple:
+        """Returns (kits, index_entries, kit_hashes), all in catalog order."""
+        raise NotImplementedError
+
+    def save(self, key: str, brand_kit: dict):
+        """Creates or replaces one kit durably. New kits go to the end of the catalog."""
+        raise NotImplementedError
+
+    def delete(self, key: str) -> bool:
+        """Deletes one kit. Returns False if it did not exist."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class JsonBrandKitRepository(BrandKitRepository):
+    """
+    Brand kits in a JSON file ({key: kit}) or a directory of per-brand files
+    (<key>.json holding one kit). The whole catalog is parsed on every load. Writes
+    replace the file atomically; with a single file each write rewrites the catalog.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+
+    def _source_files(self) -> list:
+        if self.path.is_dir():
+            # glob matches dotfiles too; skip them (editor swap files, leftover temp files).
+            return sorted(path for path in self.path.glob("*.json") if not path.name.startswith("."))
+        return [self.path] if self.path.exists() else []
+
+    def fingerprint(self) -> tuple:
+        fingerprint = []
+        for path in self._source_files():
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            fingerprint.append((path.name, stat.st_mtime_ns, stat.st_size))
+        return tuple(fingerprint)
+
+    def read_kits(self) -> dict:
+        if self.path.is_dir():
+            kits = {}
+            for path in self._source_files():
+                with open(path, "r") as f:
+                    kits[path.stem] = json.load(f)
+        else:
+            with open(self.path, "r") as f:
+                kits = json.load(f)
+        if not isinstance(kits, dict) or not all(isinstance(kit, dict) for kit in kits.values()):
+            raise ValueError("brand kits must be a JSON object mapping brand keys to kit objects")
+        return kits
+
+    def load(self) -> tuple:
+        kits = self.read_kits()
+        return kits, kits, {key: brand_kit_hash(kit) for key, kit in kits.items()}
+
+    def save(self, key: str, brand_kit: dict):
+        if self.path.is_dir():
+            write_json_atomic(self.path / f"{key}.json", brand_kit)
+            return
+        kits = self.read_kits() if self.path.exists() else {}
+        kits[key] = brand_kit
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        write_json_atomic(self.path, kits)
+
+    def delete(self, key: str) -> bool:
+        if self.path.is_dir():
+            path = self.path / f"{key}.json"
+            if not path.exists():
+                return False
+            path.unlink()
+            return True
+        kits = self.read_kits() if self.path.exists() else {}
+        if kits.pop(key, None) is None:
+            return False
+        write_json_atomic(self.path, kits)
+        return True
+
+
+class LazyBrandKits(Mapping):
+    """Read-only mapping over a SQLite catalog that parses each kit on first access."""
+
+    def __init__(self, repository: "SQLiteBrandKitRepository", kit_hashes: dict):
+        self.repository = repository
+        self._kit_hashes = kit_hashes
+
+    def __getitem__(self, key: str) -> dict:
+        if key not in self._kit_hashes:
+            raise KeyError(key)
+        kit = self.repository.get(key, self._kit_hashes[key])
+        if kit is None:
+            raise KeyError(key)
+        return kit
+
+    def __iter__(self):
+        return iter(self._kit_hashes)
+
+    def __len__(self) -> int:
+        return len(self._kit_hashes)
+
+
+class SQLiteBrandKitRepository(BrandKitRepository):
+    """
+    Brand kits stored one row per brand in SQLite, with an alias table indexed by alias
+    and key. Loading the catalog reads only keys, brand names, aliases and content hashes;
+    full kits are parsed on demand and kept in an LRU. Kit contents are also kept by
+    content hash, so a snapshot always reads the version it was loaded with even after
+    the kit is edited; replaced versions are pruned after SUPERSEDED_VERSION_RETENTION_SECONDS.
+    Every write bumps a catalog revision, which is what the store watches for changes.
+    """
+
+    def __init__(self, db_path: str, cache_entries: int = 256):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._parsed = LRUCache(max_entries=cache_entries)
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS brand_kits ("
+            "key TEXT PRIMARY KEY, position INTEGER NOT NULL, brand_name TEXT, "
+            "data TEXT NOT NULL, content_hash TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS brand_kit_aliases ("
+            "alias TEXT NOT NULL, key TEXT NOT NULL REFERENCES brand_kits (key) ON DELETE CASCADE, "
+            "PRIMARY KEY (alias, key))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS brand_kit_aliases_key ON brand_kit_aliases (key)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS brand_kit_versions ("
+            "content_hash TEXT PRIMARY KEY, data TEXT NOT NULL, superseded_at REAL)"
+        )
+        # Catalogs created before versions were kept start with their current kits.
+        self._conn.execute(
+            "INSERT OR IGNORE INTO brand_kit_versions (content_hash, data) SELECT content_hash, data FROM brand_kits"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS catalog_meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._conn.execute("INSERT OR IGNORE INTO catalog_meta (name, value) VALUES ('revision', 0)")
+
+    def fingerprint(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT value FROM catalog_meta WHERE name = 'revision'").fetchone()[0]
+
+    def load(self) -> tuple:
+        with self._lock:
+            rows = self._conn.execute("SELECT key, brand_name, content_hash FROM brand_kits ORDER BY position, key").fetchall()
+            alias_rows = self._conn.execute("SELECT key, alias FROM brand_kit_aliases").fetchall()
+        aliases = {}
+        for key, alias in alias_rows:
+            aliases.setdefault(key, []).append(alias)
+        index_entries = {key: {"brand_name": brand_name or "", "aliases": aliases.get(key, [])} for key, brand_name, _ in rows}
+        kit_hashes = {key: content_hash for key, _, content_hash in rows}
+        return LazyBrandKits(self, kit_hashes), index_entries, kit_hashes
+
+    def get(self, key: str, content_hash: Optional[str] = None) -> Optional[dict]:
+        """
+        Returns the parsed kit. With content_hash, exactly that version is returned (None if it
+        has been pruned), never a newer one; without it, the current version.
+        """
+        if content_hash is not None:
+            kit = self._parsed.get(f"{key}:{content_hash}")
+            if kit is not None:
+                return kit
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT data, content_hash FROM brand_kit_versions WHERE content_hash = ?", (content_hash,)
+                ).fetchone()
+        else:
+            with self._lock:
+                row = self._conn.execute("SELECT data, content_hash FROM brand_kits WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        kit = json.loads(row[0])
+        self._parsed.set(f"{key}:{row[1]}", kit)
+        return kit
+
+    def _supersede_locked(self, content_hash: Optional[str], now: float):
+        """Marks a version as replaced unless a kit still uses it, and prunes expired versions."""
+        if content_hash is not None:
+            self._conn.execute(
+                "UPDATE brand_kit_versions SET superseded_at = ? WHERE content_hash = ? "
+                "AND NOT EXISTS (SELECT 1 FROM brand_kits WHERE content_hash = ?)",
+                (now, content_hash, content_hash),
+            )
+        self._conn.execute(
+            "DELETE FROM brand_kit_versions WHERE superseded_at < ?", (now - SUPERSEDED_VERSION_RETENTION_SECONDS,)
+        )
+
+    def import_kits(self, kits: dict, replace: bool = False) -> int:
+        """
+        Upserts kits ({key: kit}, e.g. the contents of database.json) in one transaction.
+        With replace, kits not in the input are deleted. Returns the number of kits written.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                previous_hashes = dict(self._conn.execute("SELECT key, content_hash FROM brand_kits").fetchall())
+                if replace:
+                    self._conn.execute("DELETE FROM brand_kits")
+                next_position = self._conn.execute("SELECT COALESCE(MAX(position) + 1, 0) FROM brand_kits").fetchone()[0]
+                for position, (key, kit) in enumerate(kits.items(), start=next_position):
+                    # Existing kits keep their position so catalog order (the brand match tie-break) is stable.
+                    data, content_hash = json.dumps(kit), brand_kit_hash(kit)
+                    self._conn.execute(
+                        "INSERT INTO brand_kits (key, position, brand_name, data, content_hash, updated_at) VALUES (?, ?, ?, ?, ?, ?) "
+                        "ON CONFLICT (key) DO UPDATE SET brand_name = excluded.brand_name, data = excluded.data, "
+                        "content_hash = excluded.content_hash, updated_at = excluded.updated_at",
+                        (key, position, kit.get("brand_name"), data, content_hash, now),
+                    )
+                    self._conn.execute(
+                        "INSERT INTO brand_kit_versions (content_hash, data) VALUES (?, ?) "
+                        "ON CONFLICT (content_hash) DO UPDATE SET superseded_at = NULL",
+                        (content_hash, data),
+                    )
+                    self._conn.execute("DELETE FROM brand_kit_aliases WHERE key = ?", (key,))
+                    self._conn.executemany(
+                        "INSERT INTO brand_kit_aliases (alias, key) VALUES (?, ?)",
+                        [(alias, key) for alias in kit_aliases(key, kit)],
+                    )
+                for content_hash in set(previous_hashes.values()):
+                    self._supersede_locked(content_hash, now)
+                self._conn.execute("UPDATE catalog_meta SET value = value + 1 WHERE name = 'revision'")
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return len(kits)
+
+    def save(self, key: str, brand_kit: dict):
+        self.import_kits({key: brand_kit})
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT content_hash FROM brand_kits WHERE key = ?", (key,)).fetchone()
+                deleted = self._conn.execute("DELETE FROM brand_kits WHERE key = ?", (key,)).rowcount > 0
+                if deleted:
+                    self._supersede_locked(row[0], time.time())
+                    self._conn.execute("UPDATE catalog_meta SET value = value + 1 WHERE name = 'revision'")
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return deleted
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# Available brand kit backends, selected by BRAND_KITS_BACKEND.
+BRAND_KIT_REPOSITORIES = {
+    "json": JsonBrandKitRepository,
+    "sqlite": SQLiteBrandKitRepository,
+}
+
+
+def create_brand_kit_repository(backend: str, location: str) -> BrandKitRepository:
+    """Instantiates the named brand kit backend at location (a JSON file/directory, or a SQLite database)."""
+    try:
+        repository_class = BRAND_KIT_REPOSITORIES[backend]
+    except KeyError:
+        raise ValueError(f"Unknown brand kit backend '{backend}'. Available: {list(BRAND_KIT_REPOSITORIES)}")
+    return repository_class(location)
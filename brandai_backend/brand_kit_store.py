@@ -0,0 +1,197 @@
+import threading
+import time
+from collections.abc import Mapping
+from datetime import datetime
+from types import MappingProxyType
+from typing import Optional
+
+from brand_index import DEFAULT_MIN_MATCH_SCORE, BrandIndex
+from brand_kit_repository import LazyBrandKits, brand_kit_hash
+
+
+class BrandKitConflict(Exception):
+    """Raised when a write's expected kit hash (an If-Match ETag) no longer matches the stored kit."""
+
+
+class BrandKitWriteError(Exception):
+    """Raised when the repository fails to persist a kit write (unreadable source, I/O or database error)."""
+
+
+class BrandKitSnapshot:
+    """
+    One immutable generation of the brand kits: the kits themselves, their brand index and
+    content hashes, and a version number that increases with every reload. Requests take
+    the current snapshot once and use it throughout, so a reload never changes the kits
+    under an evaluation that is already running. The kit dicts must not be mutated.
+
+    kits may be a lazy mapping (see LazyBrandKits); index_entries then supplies the
+    brand names and aliases the index needs without parsing every kit.
+    """
+
+    __slots__ = ("version", "kits", "index", "index_entries", "kit_hashes", "loaded_at")
+
+    def __init__(self, version: int, kits: Mapping, kit_hashes: dict, index_entries: Optional[dict] = None, min_match_score: float = DEFAULT_MIN_MATCH_SCORE):
+        self.version = version
+        self.kits = MappingProxyType(kits) if isinstance(kits, dict) else kits
+        self.index_entries = index_entries if index_entries is not None else kits
+        self.index = BrandIndex(self.index_entries, min_score=min_match_score)
+        self.kit_hashes = MappingProxyType(dict(kit_hashes))
+        self.loaded_at = time.time()
+
+    def with_kit(self, key: str, brand_kit: Optional[dict], min_match_score: float = DEFAULT_MIN_MATCH_SCORE) -> "BrandKitSnapshot":
+        """
+        Copy of this snapshot, at the next version, with one kit added or replaced (or
+        removed, for brand_kit=None). Other kits are shared with this snapshot, not re-read.
+        """
+        kit_hashes = dict(self.kit_hashes)
+        index_entries = dict(self.index_entries)
+        if brand_kit is None:
+            kit_hashes.pop(key, None)
+            index_entries.pop(key, None)
+        else:
+            kit_hashes[key] = brand_kit_hash(brand_kit)
+            index_entries[key] = brand_kit
+        if isinstance(self.kits, LazyBrandKits):
+            kits = LazyBrandKits(self.kits.repository, kit_hashes)
+        else:
+            kits = {k: brand_kit if k == key else v for k, v in self.kits.items() if k in kit_hashes}
+            if brand_kit is not None and key not in kits:
+                kits[key] = brand_kit
+        return BrandKitSnapshot(self.version + 1, kits, kit_hashes, index_entries, min_match_score)
+
+
+class BrandKitStore:
+    """
+    Serves the current BrandKitSnapshot of a BrandKitRepository. A background thread
+    polls the repository's fingerprint and swaps in a new snapshot when it changes, so
+    kit edits are picked up without a restart. A source that fails to load leaves the
+    current snapshot in place.
+    """
+
+    def __init__(self, repository, min_match_score: float = DEFAULT_MIN_MATCH_SCORE, poll_interval: float = 0.5):
+        self.repository = repository
+        self.min_match_score = min_match_score
+        self.poll_interval = poll_interval
+        self._snapshot = BrandKitSnapshot(0, {}, {}, min_match_score=min_match_score)
+        self._fingerprint = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """Registers callback(snapshot), called after each new snapshot is swapped in."""
+        self._listeners.append(callback)
+
+    def _notify(self, snapshot: BrandKitSnapshot):
+        # Called outside the store lock, so listeners may do slow work (e.g. network calls).
+        for callback in self._listeners:
+            try:
+                callback(snapshot)
+            except Exception as e:
+                print(f"Warning: Brand kit listener failed: {e}")
+
+    @property
+    def snapshot(self) -> BrandKitSnapshot:
+        """The current snapshot. Swapped atomically; never modified in place."""
+        return self._snapshot
+
+    def reload(self, force: bool = False) -> bool:
+        """
+        Reloads the repository if it changed since the last load (or always, with force).
+        Returns True if a new snapshot was swapped in.
+        """
+        with self._lock:
+            changed = self._reload_locked(force)
+            snapshot = self._snapshot
+        if changed:
+            self._notify(snapshot)
+        return changed
+
+    def _reload_locked(self, force: bool = False) -> bool:
+        try:
+            fingerprint = self.repository.fingerprint()
+            if not force and fingerprint == self._fingerprint:
+                return False
+            # Recorded even on failure, so a broken source is reported once rather than on every poll.
+            self._fingerprint = fingerprint
+            kits, index_entries, kit_hashes = self.repository.load()
+        except Exception as e:
+            print(f"Warning: Could not load brand kits. Keeping version {self._snapshot.version}. Error: {e}")
+            return False
+        self._snapshot = BrandKitSnapshot(self._snapshot.version + 1, kits, kit_hashes, index_entries, self.min_match_score)
+        print(f"Loaded {len(kit_hashes)} brand kits (version {self._snapshot.version}): {list(kit_hashes)[:20]}")
+        return True
+
+    def _write(self, key: str, brand_kit: Optional[dict], expected_hash: Optional[str]) -> BrandKitSnapshot:
+        # Callers reload first, so outside edits are neither lost from memory nor hidden
+        # from the watcher by the fingerprint recorded after this write.
+        if expected_hash is not None and self._snapshot.kit_hashes.get(key) != expected_hash:
+            raise BrandKitConflict(key)
+        deleted = True
+        try:
+            if brand_kit is None:
+                deleted = self.repository.delete(key)
+            else:
+                self.repository.save(key, brand_kit)
+        except Exception as e:
+            raise BrandKitWriteError(f"Could not write brand kit '{key}' to the brand kit source: {e}") from e
+        if not deleted:
+            raise KeyError(key)
+        self._fingerprint = self.repository.fingerprint()
+        self._snapshot = self._snapshot.with_kit(key, brand_kit, self.min_match_score)
+        return self._snapshot
+
+    def save_kit(self, key: str, brand_kit: dict, expected_hash: Optional[str] = None) -> BrandKitSnapshot:
+        """
+        Creates or replaces a kit, setting its "version" to the stored version + 1, and
+        persists it before swapping in a snapshot that contains it. expected_hash, if
+        given, must match the stored kit's hash (BrandKitConflict otherwise). Raises
+        BrandKitWriteError if the repository cannot be written. Returns the new snapshot.
+        """
+        with self._lock:
+            self._reload_locked()
+            current = self._snapshot.kits.get(key)
+            version = (current.get("version", 0) if current else 0) + 1
+            snapshot = self._write(key, dict(brand_kit, version=version), expected_hash)
+        self._notify(snapshot)
+        return snapshot
+
+    def delete_kit(self, key: str, expected_hash: Optional[str] = None) -> BrandKitSnapshot:
+        """
+        Deletes a kit (KeyError if it does not exist, BrandKitWriteError if the repository
+        cannot be written) and returns the new snapshot.
+        """
+        with self._lock:
+            self._reload_locked()
+            snapshot = self._write(key, None, expected_hash)
+        self._notify(snapshot)
+        return snapshot
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            self.reload()
+
+    def start_watching(self):
+        """Starts the background thread that picks up changes to the source."""
+        if self._thread is not None or self.poll_interval <= 0:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="brand-kit-watcher", daemon=True)
+        self._thread.start()
+
+    def stop_watching(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        return {
+            "version": snapshot.version,
+            "brand_kits": len(snapshot.kits),
+            "loaded_at": datetime.fromtimestamp(snapshot.loaded_at).isoformat(),
+            "watching": self._thread is not None,
+        }
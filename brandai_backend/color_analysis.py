@@ -0,0 +1,124 @@
+import io
+import re
+from typing import Optional
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from image_processing import flatten_onto_white
+
+# Longest edge of the pixel sample used for color statistics.
+SAMPLE_EDGE = 96
+
+# CIE76 distance under which a pixel counts as a given palette color. About 2.3 is a just
+# noticeable difference; ads carry shading, gradients and compression, so this is looser.
+DEFAULT_DELTA_E_THRESHOLD = 20.0
+
+HEX_COLOR_PATTERN = re.compile(r"^#?([0-9a-fA-F]{6}|[0-9a-fA-F]{3})$")
+
+# Linear sRGB to CIE XYZ, D65 white point.
+_RGB_TO_XYZ = np.array([
+    [0.4124564, 0.3575761, 0.1804375],
+    [0.2126729, 0.7151522, 0.0721750],
+    [0.0193339, 0.1191920, 0.9503041],
+], dtype=np.float32)
+_D65_WHITE = np.array([0.95047, 1.0, 1.08883], dtype=np.float32)
+
+
+def load_pixels(image_bytes: bytes, max_edge: int = SAMPLE_EDGE) -> np.ndarray:
+    """
+    Decodes an image into an (N, 3) float32 array of RGB pixels, downsampled so its longest
+    edge is at most max_edge. Transparency is flattened onto white, as for upstream uploads.
+    """
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        # For JPEGs this decodes at a reduced scale directly, which is much faster.
+        image.draft("RGB", (max_edge, max_edge))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_edge, max_edge))
+        pixels = np.asarray(flatten_onto_white(image).convert("RGB"), dtype=np.float32)
+    return pixels.reshape(-1, 3)
+
+
+def _initial_centers(pixels: np.ndarray, clusters: int) -> np.ndarray:
+    """Deterministic seeds: the mean colors of the most populated cells of a coarse 8x8x8 RGB grid."""
+    quantized = pixels.astype(np.uint8) >> 5
+    cells = (quantized[:, 0].astype(np.int32) << 6) | (quantized[:, 1].astype(np.int32) << 3) | quantized[:, 2]
+    counts = np.bincount(cells, minlength=512)
+    top_cells = np.argsort(-counts, kind="stable")[:clusters]
+    top_cells = top_cells[counts[top_cells] > 0]
+    return np.stack([pixels[cells == cell].mean(axis=0) for cell in top_cells])
+
+
+def dominant_colors(image_bytes: bytes, max_colors: int = 5, clusters: int = 8, iterations: int = 10) -> list:
+    """
+    Dominant colors of an image by k-means over a downsampled pixel array, in the same shape as
+    the Vision API's image properties: [{"hex": "#rrggbb", "percent": <pixel fraction>}], largest
+    first. Seeding is deterministic, so the same image always yields the same colors.
+    """
+    pixels = load_pixels(image_bytes)
+    centers = _initial_centers(pixels, clusters)
+    for _ in range(iterations):
+        distances = ((pixels[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+        labels = distances.argmin(axis=1)
+        counts = np.bincount(labels, minlength=len(centers))
+        sums = np.stack([np.bincount(labels, weights=pixels[:, channel], minlength=len(centers)) for channel in range(3)], axis=1)
+        updated = np.where(counts[:, None] > 0, sums / np.maximum(counts, 1)[:, None], centers)
+        converged = np.abs(updated - centers).max() < 0.5
+        centers = updated
+        if converged:
+            break
+
+    labels = ((pixels[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2).argmin(axis=1)
+    counts = np.bincount(labels, minlength=len(centers))
+    colors = []
+    for cluster in np.argsort(-counts, kind="stable")[:max_colors]:
+        if counts[cluster] == 0:
+            break
+        red, green, blue = (int(round(value)) for value in np.clip(centers[cluster], 0, 255))
+        colors.append({"hex": f"#{red:02x}{green:02x}{blue:02x}", "percent": round(float(counts[cluster]) / len(pixels), 4)})
+    return colors
+
+
+def parse_hex_color(value: str) -> Optional[tuple]:
+    """Parses "#rrggbb" or "#rgb" (the "#" is optional) into an (r, g, b) tuple, or None if invalid."""
+    match = HEX_COLOR_PATTERN.match(value.strip()) if isinstance(value, str) else None
+    if match is None:
+        return None
+    digits = match.group(1)
+    if len(digits) == 3:
+        digits = "".join(digit * 2 for digit in digits)
+    return tuple(int(digits[i:i + 2], 16) for i in (0, 2, 4))
+
+
+def rgb_to_lab(rgb: np.ndarray) -> np.ndarray:
+    """Converts an (N, 3) array of sRGB values in 0-255 to CIE L*a*b* (D65)."""
+    rgb = rgb.astype(np.float32) / 255.0
+    linear = np.where(rgb <= 0.04045, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+    xyz = linear @ _RGB_TO_XYZ.T / _D65_WHITE
+    f = np.where(xyz > 0.008856, np.cbrt(xyz), 7.787 * xyz + 16.0 / 116.0)
+    return np.stack([116.0 * f[:, 1] - 16.0, 500.0 * (f[:, 0] - f[:, 1]), 200.0 * (f[:, 1] - f[:, 2])], axis=1)
+
+
+def palette_compliance(image_bytes: bytes, palette_hex: list, threshold: float = DEFAULT_DELTA_E_THRESHOLD) -> Optional[dict]:
+    """
+    Scores how much of an image is drawn from a brand palette. Every pixel is assigned to its
+    nearest palette color in Lab space; it is compliant when that Delta-E (CIE76) is within
+    threshold. Returns {"score": <compliant pixel fraction>, "delta_e_threshold": threshold,
+    "colors": [{"hex", "percent"}]} with the share of pixels matched to each palette entry,
+    or None when the palette has no valid colors.
+    """
+    entries = [(value, parse_hex_color(value)) for value in palette_hex]
+    entries = [(value, rgb) for value, rgb in entries if rgb is not None]
+    if not entries:
+        return None
+    pixels = rgb_to_lab(load_pixels(image_bytes))
+    palette = rgb_to_lab(np.array([rgb for _, rgb in entries], dtype=np.float32))
+    distances = np.sqrt(((pixels[:, None, :] - palette[None, :, :]) ** 2).sum(axis=2))
+    nearest = distances.argmin(axis=1)
+    compliant = distances[np.arange(len(pixels)), nearest] <= threshold
+    counts = np.bincount(nearest[compliant], minlength=len(entries))
+    return {
+        "score": round(float(compliant.mean()), 4),
+        "delta_e_threshold": threshold,
+        "colors": [{"hex": value, "percent": round(float(count) / len(pixels), 4)} for (value, _), count in zip(entries, counts)],
+    }
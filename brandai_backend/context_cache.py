@@ -0,0 +1,241 @@
+import threading
+import time
+from datetime import timedelta
+from typing import Optional
+
+from vertexai.generative_models import Content, Part
+
+from google_clients import GEMINI_MODEL_NAME
+
+
+class ContextCacheBackend:
+    """
+    Creates and manages server-side cached prompt prefixes. A handle is whatever the
+    backend needs to refresh, delete or generate with a cached prefix.
+    """
+
+    def create(self, display_name: str, prefix: str, ttl_seconds: float):
+        raise NotImplementedError
+
+    def refresh(self, handle, ttl_seconds: float):
+        raise NotImplementedError
+
+    def delete(self, handle):
+        raise NotImplementedError
+
+    def model(self, handle):
+        """A model whose generate_content runs with the cached prefix as its system instruction."""
+        raise NotImplementedError
+
+
+class VertexContextCacheBackend(ContextCacheBackend):
+    """
+    Vertex AI cached contents holding the prefix as the system instruction. Context caching
+    needs a recent google-cloud-aiplatform, so it is only imported when this backend is used.
+    """
+
+    def __init__(self, model_name: str = GEMINI_MODEL_NAME):
+        from vertexai.preview import generative_models as preview_generative_models
+        from vertexai.preview.caching import CachedContent
+
+        self.model_name = model_name
+        self._cached_content = CachedContent
+        self._generative_models = preview_generative_models
+
+    def create(self, display_name: str, prefix: str, ttl_seconds: float):
+        return self._cached_content.create(
+            model_name=self.model_name,
+            system_instruction=Content(role="system", parts=[Part.from_text(prefix)]),
+            ttl=timedelta(seconds=ttl_seconds),
+            display_name=display_name,
+        )
+
+    def refresh(self, handle, ttl_seconds: float):
+        handle.update(ttl=timedelta(seconds=ttl_seconds))
+
+    def delete(self, handle):
+        handle.delete()
+
+    def model(self, handle):
+        return self._generative_models.GenerativeModel.from_cached_content(handle)
+
+
+class FakeCachedModel:
+    """Stands in for a model bound to cached content by sending the prefix inline."""
+
+    def __init__(self, base_model, prefix: str):
+        self.base_model = base_model
+        self.prefix = prefix
+
+    def generate_content(self, contents: list, **kwargs):
+        return self.base_model.generate_content([self.prefix, *contents], **kwargs)
+
+
+class FakeContextCacheBackend(ContextCacheBackend):
+    """
+    In-process backend for tests and local development: no cached contents are created
+    remotely, requests carry the prefix inline, and every call is recorded in `calls`.
+    """
+
+    def __init__(self, model_factory):
+        self.model_factory = model_factory
+        self.calls = []
+        self.live = {}
+
+    def create(self, display_name: str, prefix: str, ttl_seconds: float):
+        self.calls.append(("create", display_name))
+        self.live[display_name] = prefix
+        return display_name
+
+    def refresh(self, handle, ttl_seconds: float):
+        self.calls.append(("refresh", handle))
+
+    def delete(self, handle):
+        self.calls.append(("delete", handle))
+        self.live.pop(handle, None)
+
+    def model(self, handle):
+        return FakeCachedModel(self.model_factory(), self.live[handle])
+
+
+class BrandContextCache:
+    """
+    One cached prompt prefix per brand, tied to the brand kit version it was compiled from.
+    A cache whose kit changed or was deleted is evicted; a live one is refreshed when it
+    gets within refresh_margin_seconds of expiry. Creation failures (for example a prefix
+    under the model's minimum cacheable size) are remembered per kit version, so those
+    requests go out with the prefix inline instead of retrying the create each time.
+    """
+
+    def __init__(self, backend: ContextCacheBackend, ttl_seconds: float = 3600, refresh_margin_seconds: float = 300):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin_seconds = min(refresh_margin_seconds, ttl_seconds / 2)
+        self._entries = {}
+        self._failed = {}
+        self._brand_locks = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "created": 0, "refreshed": 0, "evicted": 0, "failed": 0}
+
+    def model_for(self, brand_prompt) -> Optional[object]:
+        """
+        Returns a model bound to the brand's cached prefix, or None to send the prefix inline.
+        Network calls run outside the shared lock under a per-brand lock; while one request
+        creates or refreshes a brand's cache, others for that brand use the current cache if
+        it is still live and go inline otherwise, so no request waits on the round trip.
+        """
+        brand_key = brand_prompt.brand_key
+        with self._lock:
+            entry = self._entries.get(brand_key)
+            if self._is_fresh(entry, brand_prompt):
+                self._stats["hits"] += 1
+                return entry["model"]
+            brand_lock = self._brand_locks.setdefault(brand_key, threading.Lock())
+        if not brand_lock.acquire(blocking=False):
+            with self._lock:
+                entry = self._entries.get(brand_key)
+                if entry is not None and entry["kit_hash"] == brand_prompt.kit_hash and entry["expires_at"] > time.time():
+                    self._stats["hits"] += 1
+                    return entry["model"]
+            return None
+        try:
+            return self._update(brand_prompt)
+        finally:
+            brand_lock.release()
+
+    def _is_fresh(self, entry: Optional[dict], brand_prompt) -> bool:
+        return (
+            entry is not None and entry["kit_hash"] == brand_prompt.kit_hash
+            and entry["expires_at"] - time.time() >= self.refresh_margin_seconds
+        )
+
+    def _update(self, brand_prompt) -> Optional[object]:
+        """Creates, replaces or refreshes one brand's cache. Called with that brand's lock held."""
+        brand_key = brand_prompt.brand_key
+        stale = None
+        with self._lock:
+            entry = self._entries.get(brand_key)
+            if self._is_fresh(entry, brand_prompt):
+                # Refreshed or created by the request that held the brand lock before us.
+                self._stats["hits"] += 1
+                return entry["model"]
+            if entry is not None and entry["kit_hash"] != brand_prompt.kit_hash:
+                stale = self._pop_locked(brand_key)
+                entry = None
+            failed = entry is None and self._failed.get(brand_key) == brand_prompt.kit_hash
+        if stale is not None:
+            self._delete(brand_key, stale)
+        if failed:
+            return None
+        if entry is None:
+            return self._create(brand_prompt)
+
+        try:
+            self.backend.refresh(entry["handle"], self.ttl_seconds)
+        except Exception as e:
+            print(f"Warning: Could not refresh context cache for '{brand_key}'. Error: {e}")
+            with self._lock:
+                stale = self._pop_locked(brand_key) if self._entries.get(brand_key) is entry else None
+            if stale is not None:
+                self._delete(brand_key, stale)
+            return None
+        with self._lock:
+            if self._entries.get(brand_key) is not entry:
+                # Evicted by sync() or close() during the refresh.
+                return None
+            entry["expires_at"] = time.time() + self.ttl_seconds
+            self._stats["refreshed"] += 1
+            return entry["model"]
+
+    def _create(self, brand_prompt) -> Optional[object]:
+        brand_key = brand_prompt.brand_key
+        display_name = f"brandai-{brand_key}-{brand_prompt.kit_hash[:12]}"
+        try:
+            handle = self.backend.create(display_name, brand_prompt.prefix, self.ttl_seconds)
+            model = self.backend.model(handle)
+        except Exception as e:
+            print(f"Warning: Could not create context cache for '{brand_key}', sending the prompt inline. Error: {e}")
+            with self._lock:
+                self._failed[brand_key] = brand_prompt.kit_hash
+                self._stats["failed"] += 1
+            return None
+        entry = {"kit_hash": brand_prompt.kit_hash, "handle": handle, "model": model, "expires_at": time.time() + self.ttl_seconds}
+        with self._lock:
+            self._entries[brand_key] = entry
+            self._failed.pop(brand_key, None)
+            self._stats["created"] += 1
+        return model
+
+    def _pop_locked(self, brand_key: str) -> Optional[dict]:
+        entry = self._entries.pop(brand_key, None)
+        if entry is not None:
+            self._stats["evicted"] += 1
+        return entry
+
+    def _delete(self, brand_key: str, entry: dict):
+        try:
+            self.backend.delete(entry["handle"])
+        except Exception as e:
+            # The server-side TTL removes it eventually.
+            print(f"Warning: Could not delete context cache for '{brand_key}'. Error: {e}")
+
+    def sync(self, snapshot):
+        """Evicts caches for brands whose kit changed or was removed in the snapshot."""
+        with self._lock:
+            stale = [
+                (brand_key, self._pop_locked(brand_key)) for brand_key, entry in list(self._entries.items())
+                if snapshot.kit_hashes.get(brand_key) != entry["kit_hash"]
+            ]
+        for brand_key, entry in stale:
+            self._delete(brand_key, entry)
+
+    def close(self):
+        """Deletes every cached prefix."""
+        with self._lock:
+            stale = [(brand_key, self._pop_locked(brand_key)) for brand_key in list(self._entries)]
+        for brand_key, entry in stale:
+            self._delete(brand_key, entry)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries))
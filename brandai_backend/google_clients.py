@@ -0,0 +1,106 @@
+import threading
+from datetime import datetime
+
+from google.cloud import vision
+from google.cloud.vision_v1.services.image_annotator.transports import ImageAnnotatorGrpcTransport
+from vertexai.generative_models import GenerativeModel
+from vertexai.preview.vision_models import ImageGenerationModel
+
+GEMINI_MODEL_NAME = "gemini-2.0-flash"
+IMAGEN_MODEL_NAME = "imagen-3.0-generate-001"
+
+# Keep the shared Vision gRPC channel warm between requests so idle periods
+# don't force a new TLS handshake on the next /evaluate call.
+VISION_CHANNEL_OPTIONS = [
+    ("grpc.keepalive_time_ms", 30000),
+    ("grpc.keepalive_timeout_ms", 10000),
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.max_pings_without_data", 0),
+    ("grpc.max_send_message_length", -1),
+    ("grpc.max_receive_message_length", -1),
+]
+
+
+class GoogleClientRegistry:
+    """
+    Holds the long-lived Google Cloud clients shared by every request.
+    Clients are created once in the app lifespan; any client that fails to
+    start is retried lazily on first use and its error is kept for /health.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._errors = {}
+        self._started_at = {}
+        self._factories = {
+            "vision": self._create_vision_client,
+            "gemini": lambda: GenerativeModel(GEMINI_MODEL_NAME),
+            "imagen": lambda: ImageGenerationModel.from_pretrained(IMAGEN_MODEL_NAME),
+        }
+
+    @staticmethod
+    def _create_vision_client() -> vision.ImageAnnotatorClient:
+        channel = ImageAnnotatorGrpcTransport.create_channel(
+            host="vision.googleapis.com:443", options=VISION_CHANNEL_OPTIONS
+        )
+        return vision.ImageAnnotatorClient(transport=ImageAnnotatorGrpcTransport(channel=channel))
+
+    def start(self):
+        """Eagerly create every client, recording failures instead of raising."""
+        for name in self._factories:
+            try:
+                self.get(name)
+            except Exception as e:
+                print(f"Warning: Could not initialize {name} client. Error: {e}")
+        print(f"Google client registry started: {self.health()['clients']}")
+
+    def get(self, name: str):
+        """Returns the shared client for an upstream, creating it if needed."""
+        client = self._clients.get(name)
+        if client is not None:
+            return client
+        with self._lock:
+            client = self._clients.get(name)
+            if client is None:
+                try:
+                    client = self._factories[name]()
+                except Exception as e:
+                    self._errors[name] = str(e)
+                    raise
+                self._clients[name] = client
+                self._errors.pop(name, None)
+                self._started_at[name] = datetime.now().isoformat()
+            return client
+
+    def vision_client(self) -> vision.ImageAnnotatorClient:
+        return self.get("vision")
+
+    def gemini_model(self) -> GenerativeModel:
+        return self.get("gemini")
+
+    def imagen_model(self) -> ImageGenerationModel:
+        return self.get("imagen")
+
+    def health(self) -> dict:
+        """Reports which clients are ready and the last error for those that are not."""
+        clients = {}
+        for name in self._factories:
+            if name in self._clients:
+                clients[name] = {"status": "ready", "since": self._started_at[name]}
+            else:
+                clients[name] = {"status": "unavailable", "error": self._errors.get(name, "not initialized")}
+        healthy = all(c["status"] == "ready" for c in clients.values())
+        return {"status": "ok" if healthy else "degraded", "clients": clients}
+
+    def close(self):
+        """Closes the underlying transports and forgets all clients."""
+        with self._lock:
+            vision_client = self._clients.get("vision")
+            if vision_client is not None:
+                try:
+                    vision_client.transport.close()
+                except Exception as e:
+                    print(f"Warning: Error closing Vision client: {e}")
+            self._clients.clear()
+            self._started_at.clear()
@@ -0,0 +1,163 @@
+import io
+from typing import Optional
+
+from PIL import Image, ImageOps, features
+
+# Pillow format name and MIME type for each supported output encoding.
+OUTPUT_FORMATS = {
+    "png": ("PNG", "image/png"),
+    "jpeg": ("JPEG", "image/jpeg"),
+    "webp": ("WEBP", "image/webp"),
+    "avif": ("AVIF", "image/avif"),
+}
+
+# ISO-BMFF brands (in the leading "ftyp" box) for AVIF and HEIC/HEIF images. mif1 and msf1
+# only say "some image file format", so they map to HEIF when no more specific brand is listed.
+_FTYP_BRANDS = {
+    b"avif": "image/avif", b"avis": "image/avif",
+    b"heic": "image/heic", b"heix": "image/heic", b"hevc": "image/heic", b"hevx": "image/heic",
+    b"mif1": "image/heif", b"msf1": "image/heif",
+}
+
+
+# Formats Vision and Gemini both accept, which may go upstream without re-encoding.
+PASSTHROUGH_FORMATS = {"PNG": "image/png", "JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+# Pillow decoder and display name for each MIME type sniff_image_type recognizes.
+# AVIF and HEIC/HEIF decode only with a Pillow build or plugin (pillow-heif) providing them.
+IMAGE_TYPES = {
+    "image/jpeg": ("JPEG", "JPEG"), "image/png": ("PNG", "PNG"), "image/webp": ("WEBP", "WebP"),
+    "image/gif": ("GIF", "GIF"), "image/bmp": ("BMP", "BMP"), "image/tiff": ("TIFF", "TIFF"),
+    "image/avif": ("AVIF", "AVIF"), "image/heic": ("HEIF", "HEIC"), "image/heif": ("HEIF", "HEIF"),
+}
+
+
+def sniff_image_type(data: bytes) -> Optional[str]:
+    """
+    Returns the MIME type of an image from its leading magic bytes, or None if the
+    data is not a recognized image format. Client-supplied content types are not trusted.
+    """
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if data.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if data[4:8] == b"ftyp":
+        return _ftyp_image_type(data)
+    if data[:2] == b"BM":
+        return "image/bmp"
+    if data[:4] in (b"II*\x00", b"MM\x00*"):
+        return "image/tiff"
+    return None
+
+
+def _ftyp_image_type(data: bytes) -> Optional[str]:
+    """
+    Classifies an ISO-BMFF file by the major brand (bytes 8-12) and the compatible brands
+    that follow the minor version, up to the end of the ftyp box. An AVIF whose major brand
+    is the generic mif1 lists avif among its compatible brands and must not be read as HEIF.
+    """
+    box_size = min(int.from_bytes(data[:4], "big"), len(data))
+    brands = [data[8:12]] + [data[i:i + 4] for i in range(16, box_size - 3, 4)]
+    mime_types = [_FTYP_BRANDS[brand] for brand in brands if brand in _FTYP_BRANDS]
+    for mime_type in mime_types:
+        if mime_type != "image/heif":
+            return mime_type
+    return mime_types[0] if mime_types else None
+
+
+def image_size(image_bytes: bytes) -> Optional[tuple]:
+    """Returns (width, height) read from the image header without decoding pixels, or None if unreadable."""
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            return image.size
+    except Exception:
+        return None
+
+
+def has_transparency(image: Image.Image) -> bool:
+    """Whether an image has an alpha channel or a transparent palette entry or color key (tRNS)."""
+    return image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+
+
+def flatten_onto_white(image: Image.Image) -> Image.Image:
+    """
+    Returns image as RGB or L with any transparency composited onto white, so
+    logos on transparent PNGs stay visible instead of turning black when encoded as JPEG.
+    Opaque RGB and L images are returned as they are.
+    """
+    if not has_transparency(image):
+        return image if image.mode in ("RGB", "L") else image.convert("RGB")
+    rgba = image.convert("RGBA")
+    background = Image.new("RGB", image.size, (255, 255, 255))
+    background.paste(rgba, mask=rgba.getchannel("A"))
+    return background
+
+
+def can_decode(mime_type: str) -> bool:
+    """Whether this Pillow installation can decode the given image type."""
+    Image.init()
+    return mime_type in IMAGE_TYPES and IMAGE_TYPES[mime_type][0] in Image.OPEN
+
+
+def accepted_image_types() -> list:
+    """Image types that can be evaluated: sent upstream as-is, or decoded and re-encoded first."""
+    return [mime_type for mime_type in IMAGE_TYPES if mime_type in PASSTHROUGH_FORMATS.values() or can_decode(mime_type)]
+
+
+def transcode_image(image_bytes: bytes, output_format: str, quality: int = 85) -> tuple:
+    """
+    Re-encodes an image into output_format ("png", "jpeg", "webp" or "avif").
+    Returns (image_bytes, content_type). Falls back to the original PNG bytes when
+    the requested encoder is not available in this Pillow build.
+    """
+    output_format = output_format.lower()
+    if output_format == "png" or output_format not in OUTPUT_FORMATS:
+        return image_bytes, "image/png"
+    if output_format in ("webp", "avif") and not features.check(output_format):
+        print(f"Warning: Pillow was built without {output_format.upper()} support. Keeping PNG.")
+        return image_bytes, "image/png"
+
+    pil_format, content_type = OUTPUT_FORMATS[output_format]
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        if pil_format == "JPEG":
+            image = flatten_onto_white(image)
+        buffer = io.BytesIO()
+        image.save(buffer, format=pil_format, quality=quality)
+    return buffer.getvalue(), content_type
+
+
+def normalize_image_for_upstream(image_bytes: bytes, max_edge: int = 1536, output_format: str = "jpeg", quality: int = 85) -> tuple:
+    """
+    Decodes an upload once, applies its EXIF orientation, downsizes it so the longest
+    edge is at most max_edge and re-encodes it as a compact JPEG or WebP for Vision and
+    Gemini. Returns (image_bytes, content_type). Images that are already small enough,
+    upright and opaque are returned untouched when they are in the target format, or in
+    another format both upstreams accept and re-encoding would not make them smaller
+    (small PNGs and flat-color logos usually grow and pick up JPEG artifacts).
+    """
+    pil_format, content_type = OUTPUT_FORMATS.get(output_format.lower(), OUTPUT_FORMATS["jpeg"])
+    if pil_format == "WEBP" and not features.check("webp"):
+        pil_format, content_type = OUTPUT_FORMATS["jpeg"]
+
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        needs_resize = max(image.size) > max_edge
+        needs_rotation = image.getexif().get(0x0112, 1) != 1  # EXIF Orientation tag
+        has_alpha = has_transparency(image)
+        passthrough_type = PASSTHROUGH_FORMATS.get(image.format)
+        can_pass_through = not needs_resize and not needs_rotation and not has_alpha and passthrough_type is not None
+        if can_pass_through and image.format == pil_format:
+            return image_bytes, content_type
+
+        image = ImageOps.exif_transpose(image)
+        if needs_resize:
+            image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+        image = flatten_onto_white(image)
+        buffer = io.BytesIO()
+        image.save(buffer, format=pil_format, quality=quality)
+    if can_pass_through and buffer.tell() >= len(image_bytes):
+        return image_bytes, passthrough_type
+    return buffer.getvalue(), content_type
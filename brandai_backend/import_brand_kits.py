@@ -0,0 +1,35 @@
+"""
+Imports brand kits from the JSON format (brand_kits/database.json, or a directory of
+per-brand <key>.json files) into the SQLite brand kit backend:
+
+    python import_brand_kits.py                                  # database.json -> data/brand_kits.db
+    python import_brand_kits.py --source kits/ --db /srv/brand_kits.db --replace
+
+Running servers with BRAND_KITS_BACKEND=sqlite pick up the import on their next poll.
+"""
+import argparse
+from pathlib import Path
+
+from brand_kit_repository import JsonBrandKitRepository, SQLiteBrandKitRepository
+
+BACKEND_DIR = Path(__file__).parent
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import brand kits from JSON into SQLite.")
+    parser.add_argument("--source", default=str(BACKEND_DIR / "brand_kits" / "database.json"), help="JSON file or directory of per-brand JSON files")
+    parser.add_argument("--db", default=str(BACKEND_DIR / "data" / "brand_kits.db"), help="SQLite database to import into")
+    parser.add_argument("--replace", action="store_true", help="Delete kits that are not in the source")
+    args = parser.parse_args()
+
+    kits = JsonBrandKitRepository(args.source).read_kits()
+    repository = SQLiteBrandKitRepository(args.db)
+    try:
+        count = repository.import_kits(kits, replace=args.replace)
+    finally:
+        repository.close()
+    print(f"Imported {count} brand kits from {args.source} into {args.db}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+from urllib.parse import urlsplit
+
+import requests
+
+JOB_STATUSES = ["queued", "running", "succeeded", "failed"]
+
+# How often claim() deletes finished jobs past their retention.
+PURGE_INTERVAL_SECONDS = 60
+
+
+class JobQueue:
+    """
+    Persistent job queue stored in SQLite. Several processes can share one
+    database file: claims happen inside an IMMEDIATE transaction, and a job
+    whose worker disappears is re-queued once its lease expires. Finished jobs
+    are deleted retention_seconds after they finish (0 keeps them forever).
+    """
+
+    def __init__(self, db_path: str, lease_seconds: int = 600, max_attempts: int = 3, retention_seconds: int = 604800):
+        self.db_path = Path(db_path)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retention_seconds = retention_seconds
+        self._last_purge = 0.0
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, "
+            "payload TEXT NOT NULL, blob BLOB, result TEXT, error TEXT, webhook_url TEXT, "
+            "attempts INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL, "
+            "claimed_at REAL, finished_at REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_created_at ON jobs (status, created_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_finished_at ON jobs (finished_at)")
+
+    def submit(self, kind: str, payload: dict, blob: Optional[bytes] = None, webhook_url: Optional[str] = None) -> str:
+        """Queues a job and returns its id."""
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, status, payload, blob, webhook_url, created_at) VALUES (?, ?, 'queued', ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(payload), blob, webhook_url, time.time()),
+            )
+        return job_id
+
+    def claim(self) -> Optional[dict]:
+        """
+        Atomically takes the oldest runnable job (queued, or running with an expired lease).
+        Returns the job including its blob, or None if nothing is runnable.
+        """
+        now = time.time()
+        if self.retention_seconds and now - self._last_purge >= PURGE_INTERVAL_SECONDS:
+            self._last_purge = now
+            self.purge_finished(now - self.retention_seconds)
+        expired = now - self.lease_seconds
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = 'Job exceeded the maximum number of attempts.', finished_at = ? "
+                    "WHERE status = 'running' AND claimed_at < ? AND attempts >= ?",
+                    (now, expired, self.max_attempts),
+                )
+                row = self._conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' OR (status = 'running' AND claimed_at < ?) "
+                    "ORDER BY created_at LIMIT 1",
+                    (expired,),
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', claimed_at = ?, attempts = attempts + 1 WHERE id = ?",
+                        (now, row["id"]),
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        job = self._row_to_dict(row, include_blob=True)
+        job["status"] = "running"
+        job["attempts"] += 1
+        return job
+
+    def complete(self, job_id: str, result: dict):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'succeeded', result = ?, error = NULL, blob = NULL, finished_at = ? WHERE id = ?",
+                (json.dumps(result), time.time(), job_id),
+            )
+
+    def fail(self, job_id: str, error: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, blob = NULL, finished_at = ? WHERE id = ?",
+                (error, time.time(), job_id),
+            )
+
+    def purge_finished(self, finished_before: float) -> int:
+        """Deletes succeeded and failed jobs that finished before the given timestamp. Returns the number deleted."""
+        with self._lock:
+            deleted = self._conn.execute(
+                "DELETE FROM jobs WHERE status IN ('succeeded', 'failed') AND finished_at < ?", (finished_before,)
+            ).rowcount
+        if deleted:
+            print(f"🧹 Purged {deleted} finished jobs")
+        return deleted
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_dict(row) if row is not None else None
+
+    def stats(self) -> dict:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = {status: 0 for status in JOB_STATUSES}
+        counts.update({status: count for status, count in rows})
+        return counts
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def _row_to_dict(row: sqlite3.Row, include_blob: bool = False) -> dict:
+        job = {
+            "job_id": row["id"],
+            "kind": row["kind"],
+            "status": row["status"],
+            "payload": json.loads(row["payload"]),
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+            "webhook_url": row["webhook_url"],
+            "attempts": row["attempts"],
+            "created_at": datetime.fromtimestamp(row["created_at"]).isoformat(),
+            "finished_at": datetime.fromtimestamp(row["finished_at"]).isoformat() if row["finished_at"] else None,
+        }
+        if include_blob:
+            job["blob"] = row["blob"]
+        return job
+
+
+def public_job_view(job: dict) -> dict:
+    """The job fields returned to API clients."""
+    return {k: v for k, v in job.items() if k not in ("payload", "blob", "webhook_url")}
+
+
+def validate_webhook_url(url: str, allowed_hosts: list) -> str:
+    """
+    Checks a client-supplied webhook URL before the server will ever POST to it: it must be
+    http(s) and its host must be on allowed_hosts (exact names, or "*.example.com" for any
+    subdomain). With no allowed hosts, webhooks are disabled. Raises ValueError otherwise.
+    """
+    if not allowed_hosts:
+        raise ValueError("Webhooks are disabled on this server.")
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise ValueError("webhook_url must be an absolute http or https URL.")
+    if parts.username or parts.password:
+        raise ValueError("webhook_url must not contain credentials.")
+    host = parts.hostname.lower().rstrip(".")
+    for allowed in allowed_hosts:
+        if host == allowed or (allowed.startswith("*.") and host.endswith(allowed[1:])):
+            return url
+    raise ValueError(f"webhook_url host '{host}' is not allowed.")
+
+
+def send_webhook(job: dict):
+    """
+    POSTs the finished job to its webhook URL. Redirects are not followed, so an allowed host
+    cannot bounce the request elsewhere. Delivery failures are logged, not raised.
+    """
+    try:
+        requests.post(job["webhook_url"], json=public_job_view(job), timeout=10, allow_redirects=False)
+    except Exception as e:
+        print(f"Warning: Webhook delivery failed for job {job['job_id']}: {e}")
+
+
+async def run_job_worker(queue: JobQueue, handlers: dict, stop_event: asyncio.Event, wake_event: asyncio.Event, poll_interval: float = 1.0):
+    """
+    Pulls jobs from the queue until stop_event is set. handlers maps a job kind to an
+    async function taking the claimed job and returning a JSON-serializable result.
+    """
+    while not stop_event.is_set():
+        job = await asyncio.to_thread(queue.claim)
+        if job is None:
+            wake_event.clear()
+            try:
+                await asyncio.wait_for(wake_event.wait(), timeout=poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        print(f"⚙️  Job {job['job_id']} ({job['kind']}) started, attempt {job['attempts']}")
+        try:
+            result = await handlers[job["kind"]](job)
+            await asyncio.to_thread(queue.complete, job["job_id"], result)
+            print(f"✅ Job {job['job_id']} succeeded")
+        except Exception as e:
+            await asyncio.to_thread(queue.fail, job["job_id"], str(e))
+            print(f"❌ Job {job['job_id']} failed: {e}")
+
+        if job["webhook_url"]:
+            finished = await asyncio.to_thread(queue.get, job["job_id"])
+            await asyncio.to_thread(send_webhook, finished)
@@ -1,24 +1,42 @@
 import os
+import re
 import json
 import base64
 import io
+import asyncio
+import functools
+import hashlib
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 from pathlib import Path
 
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi import FastAPI, File, Form, Request, Response, UploadFile, HTTPException
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
-from pydantic import BaseModel
-from vertexai.preview.vision_models import ImageGenerationModel
+from pydantic import BaseModel, ConfigDict
 
 # Google Cloud Imports
 import vertexai
-from vertexai.generative_models import GenerativeModel, Part, GenerationConfig
+from vertexai.generative_models import Part, GenerationConfig
 from google.cloud import vision
 
+from google_clients import GoogleClientRegistry
+from result_cache import LRUCache, SQLiteCache, TieredCache
+from jobs import JobQueue, public_job_view, run_job_worker, validate_webhook_url
+from blob_store import create_blob_store
+from uploads import MULTIPART_OVERHEAD_BYTES, UploadSizeLimitMiddleware, read_upload, upload_too_large
+from image_processing import IMAGE_TYPES, PASSTHROUGH_FORMATS, accepted_image_types, image_size, normalize_image_for_upstream, sniff_image_type, transcode_image
+from near_duplicates import NearDuplicateIndex, image_fingerprint
+from color_analysis import DEFAULT_DELTA_E_THRESHOLD, dominant_colors, palette_compliance
+from brand_kit_store import BrandKitConflict, BrandKitSnapshot, BrandKitStore, BrandKitWriteError
+from brand_kit_repository import create_brand_kit_repository
+from prompts import BrandPrompt, BrandPromptCompiler, describe_palette_compliance
+from context_cache import BrandContextCache, FakeContextCacheBackend, VertexContextCacheBackend
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -28,20 +46,166 @@ GCP_LOCATION = os.getenv("GCP_LOCATION")
 BACKEND_PORT = int(os.getenv("BACKEND_PORT", 8000))
 BACKEND_HOST = os.getenv("BACKEND_HOST", "0.0.0.0")
 
+# --- Upstream Concurrency Configuration ---
+# Maximum number of in-flight blocking calls per Google Cloud upstream.
+UPSTREAM_CONCURRENCY = {
+    "vision": int(os.getenv("VISION_MAX_CONCURRENCY", 16)),
+    "gemini": int(os.getenv("GEMINI_MAX_CONCURRENCY", 16)),
+    "imagen": int(os.getenv("IMAGEN_MAX_CONCURRENCY", 4)),
+}
+# Maximum requests per minute per upstream (0 disables rate limiting).
+UPSTREAM_RATE_LIMITS = {
+    "vision": int(os.getenv("VISION_MAX_RPM", 0)),
+    "gemini": int(os.getenv("GEMINI_MAX_RPM", 0)),
+    "imagen": int(os.getenv("IMAGEN_MAX_RPM", 0)),
+}
+upstream_executors = {}
+google_clients = GoogleClientRegistry()
+
+# --- Upload Limits ---
+# Single-image uploads over MAX_UPLOAD_MB and batch requests over MAX_BATCH_UPLOAD_MB
+# are rejected with 413, before the body is read when Content-Length is known.
+MAX_UPLOAD_BYTES = int(float(os.getenv("MAX_UPLOAD_MB", 20)) * 1024 * 1024)
+MAX_BATCH_UPLOAD_BYTES = int(float(os.getenv("MAX_BATCH_UPLOAD_MB", 200)) * 1024 * 1024)
+
+# --- Batch Evaluation Configuration ---
+BATCH_MAX_IMAGES = int(os.getenv("BATCH_MAX_IMAGES", 500))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", 8))
+# Batch images are read from the spooled upload or zip entry in windows of this many,
+# so only one window's image bytes are held in memory at a time.
+BATCH_WINDOW_SIZE = int(os.getenv("BATCH_WINDOW_SIZE", 32))
+IMAGE_EXTENSIONS = {".png": "image/png", ".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".webp": "image/webp"}
+
+# --- Evaluation Pipeline Configuration ---
+# "sequential": one Vision call with every feature, then Gemini.
+# "pipelined": logo detection first to pick the brand kit, then the Gemini critique
+# and the remaining Vision features (safety, colors) run concurrently.
+EVALUATION_PIPELINE_MODE = os.getenv("EVALUATION_PIPELINE_MODE", "sequential").lower()
+
+# --- Dominant Colors ---
+# "local": dominant colors are computed in-process with NumPy (k-means over a downsampled
+# copy of the image) and IMAGE_PROPERTIES is left out of the Vision request.
+# "vision": the Vision API's image properties annotation is used, as before.
+DOMINANT_COLOR_ENGINE = os.getenv("DOMINANT_COLOR_ENGINE", "local").lower()
+# Palette compliance: the share of pixels within this Delta-E (CIE76) of a brand kit's
+# color_palette_hex, measured locally and reported to Gemini and in the scorecard.
+PALETTE_DELTA_E_THRESHOLD = float(os.getenv("PALETTE_DELTA_E_THRESHOLD", DEFAULT_DELTA_E_THRESHOLD))
+
+# --- Upstream Image Preprocessing ---
+# Uploads are auto-oriented, downscaled to UPSTREAM_IMAGE_MAX_EDGE and re-encoded
+# (jpeg or webp) before being sent to Vision and Gemini. The original bytes are still
+# used for cache keys, the response and any stored copy.
+UPSTREAM_IMAGE_PREPROCESS = os.getenv("UPSTREAM_IMAGE_PREPROCESS", "true").lower() == "true"
+UPSTREAM_IMAGE_MAX_EDGE = int(os.getenv("UPSTREAM_IMAGE_MAX_EDGE", 1536))
+UPSTREAM_IMAGE_FORMAT = os.getenv("UPSTREAM_IMAGE_FORMAT", "jpeg").lower()
+UPSTREAM_IMAGE_QUALITY = int(os.getenv("UPSTREAM_IMAGE_QUALITY", 85))
+# Image types Vision and Gemini both accept as-is; anything else is always re-encoded before upload.
+UPSTREAM_IMAGE_TYPES = set(PASSTHROUGH_FORMATS.values())
+# Uploads of any other type (or of a type this Pillow build cannot decode) are rejected with 415.
+ACCEPTED_IMAGE_TYPES = accepted_image_types()
+
+# --- Evaluation Cache Configuration ---
+# Repeat uploads of the same image against an unchanged brand kit are served from cache.
+# Set EVALUATION_CACHE_DB_PATH to also persist results in an on-disk SQLite tier.
+EVALUATION_CACHE_MAX_ENTRIES = int(os.getenv("EVALUATION_CACHE_MAX_ENTRIES", 256))
+EVALUATION_CACHE_TTL_SECONDS = int(os.getenv("EVALUATION_CACHE_TTL_SECONDS", 86400))
+EVALUATION_CACHE_DB_PATH = os.getenv("EVALUATION_CACHE_DB_PATH", "")
+EVALUATION_CACHE_DB_MAX_MB = int(os.getenv("EVALUATION_CACHE_DB_MAX_MB", 256))
+evaluation_cache = TieredCache(
+    LRUCache(max_entries=EVALUATION_CACHE_MAX_ENTRIES, ttl_seconds=EVALUATION_CACHE_TTL_SECONDS),
+    SQLiteCache(
+        EVALUATION_CACHE_DB_PATH, ttl_seconds=EVALUATION_CACHE_TTL_SECONDS,
+        max_bytes=EVALUATION_CACHE_DB_MAX_MB * 1024 * 1024,
+    ) if EVALUATION_CACHE_DB_PATH else None,
+)
+
+# --- Vision Cache Configuration ---
+# Vision output depends only on the image bytes, so it is cached separately and
+# survives brand kit edits that invalidate the evaluation cache.
+VISION_CACHE_MAX_ENTRIES = int(os.getenv("VISION_CACHE_MAX_ENTRIES", 1024))
+vision_cache = TieredCache(LRUCache(max_entries=VISION_CACHE_MAX_ENTRIES))
+
+# --- Near-Duplicate Detection ---
+# Evaluated images are indexed by perceptual hash. An upload within NEAR_DUPLICATE_MAX_DISTANCE
+# bits of an image whose evaluation is still cached for the same brand kit, and whose colors are
+# within NEAR_DUPLICATE_MAX_COLOR_DELTA_E of it in every cell of a coarse grid (the hash alone
+# ignores color, so a recolored copy would match), is reported as near_duplicate_of. "flag"
+# evaluates it anyway, "reuse" serves the earlier critique without calling Vision or Gemini
+# (palette compliance is still measured on the new image), and "off" disables the lookup.
+NEAR_DUPLICATE_MODE = os.getenv("NEAR_DUPLICATE_MODE", "flag").lower()
+NEAR_DUPLICATE_MAX_DISTANCE = int(os.getenv("NEAR_DUPLICATE_MAX_DISTANCE", 6))
+NEAR_DUPLICATE_MAX_COLOR_DELTA_E = float(os.getenv("NEAR_DUPLICATE_MAX_COLOR_DELTA_E", 10))
+near_duplicate_index = NearDuplicateIndex(max_entries=int(os.getenv("NEAR_DUPLICATE_MAX_ENTRIES", 10000)))
+
+# --- Blob Store Configuration ---
+# EVALUATION_IMAGE_MODE="inline" echoes the upload back as a base64 data URL;
+# "url" stores it once in the content-addressed blob store and returns /blobs/<digest>.
+EVALUATION_IMAGE_MODE = os.getenv("EVALUATION_IMAGE_MODE", "inline").lower()
+# REGENERATED_IMAGE_MODE does the same for Imagen output, optionally transcoded to
+# REGENERATED_IMAGE_FORMAT ("png", "webp" or "avif") for smaller payloads.
+REGENERATED_IMAGE_MODE = os.getenv("REGENERATED_IMAGE_MODE", "url").lower()
+REGENERATED_IMAGE_FORMAT = os.getenv("REGENERATED_IMAGE_FORMAT", "png").lower()
+BLOB_STORE_BACKEND = os.getenv("BLOB_STORE_BACKEND", "local").lower()
+BLOB_STORE_DIR = os.getenv("BLOB_STORE_DIR", str(Path(__file__).parent / "data" / "blobs"))
+BLOB_CACHE_MAX_AGE = int(os.getenv("BLOB_CACHE_MAX_AGE", 31536000))
+# Blobs are deleted this long after they were last stored; 0 keeps them forever.
+BLOB_RETENTION_SECONDS = int(os.getenv("BLOB_RETENTION_SECONDS", 604800))
+blob_store = create_blob_store(BLOB_STORE_BACKEND, BLOB_STORE_DIR, retention_seconds=BLOB_RETENTION_SECONDS)
+
+# --- Job Queue Configuration ---
+# Long-running evaluations and regenerations can be submitted as jobs and polled.
+# JOB_WORKERS are in-process workers; set it to 0 and run `python worker.py`
+# to process jobs in separate worker processes sharing the same JOB_DB_PATH.
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", str(Path(__file__).parent / "data" / "jobs.db"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", 300))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 1.0))
+# Finished jobs (and their results) are deleted this long after finishing; 0 keeps them.
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", 604800))
+# Hosts that job webhooks may be sent to, comma-separated ("hooks.example.com,*.example.org").
+# Webhook URLs come from clients, so webhooks are disabled unless this is set.
+JOB_WEBHOOK_ALLOWED_HOSTS = [h.strip().lower() for h in os.getenv("JOB_WEBHOOK_ALLOWED_HOSTS", "").split(",") if h.strip()]
+job_queue = JobQueue(JOB_DB_PATH, lease_seconds=JOB_LEASE_SECONDS, max_attempts=JOB_MAX_ATTEMPTS, retention_seconds=JOB_RETENTION_SECONDS)
+job_worker_tasks = []
+job_stop_event = asyncio.Event()
+job_wake_event = asyncio.Event()
+
 # --- FastAPI App Setup ---
 from contextlib import asynccontextmanager
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    """Initialize Vertex AI and load brand kits on startup."""
+def start_services():
+    """Initialize Vertex AI, the shared Google clients, brand kits and upstream pools."""
     if not GCP_PROJECT_ID or not GCP_LOCATION:
         print("Warning: GCP_PROJECT_ID or GCP_LOCATION not set. Google Cloud APIs will fail.")
     else:
         vertexai.init(project=GCP_PROJECT_ID, location=GCP_LOCATION)
         print(f"Vertex AI initialized for project '{GCP_PROJECT_ID}' in '{GCP_LOCATION}'")
+        google_clients.start()
     
-    load_brand_kits()
+    brand_kit_store.reload(force=True)
+    brand_kit_store.start_watching()
+    start_upstream_executors()
+
+def shutdown_services():
+    """Release upstream pools, clients and on-disk stores."""
+    shutdown_upstream_executors()
+    brand_kit_store.stop_watching()
+    brand_kit_store.repository.close()
+    if brand_context_cache is not None:
+        brand_context_cache.close()
+    google_clients.close()
+    evaluation_cache.close()
+    job_queue.close()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start shared services and in-process job workers on startup."""
+    start_services()
+    start_job_workers(JOB_WORKERS)
     yield
+    await stop_job_workers()
+    shutdown_services()
 
 app = FastAPI(
     title="BrandAI - Google Cloud Edition",
@@ -49,6 +213,16 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    limits={
+        "/evaluate": MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES,
+        "/evaluate/stream": MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES,
+        "/jobs/evaluate": MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES,
+        "/evaluate/batch": MAX_BATCH_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES,
+    },
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -61,112 +235,661 @@ class RegenerationRequest(BaseModel):
     refinement_plan: str
 
 # --- Static File and Brand Kit Configuration ---
-BRAND_KITS_PATH = Path(__file__).parent / "brand_kits" / "database.json"
+# Brand kit backend: "json" reads BRAND_KITS_PATH as a single JSON file or a directory of
+# per-brand <key>.json files; "sqlite" reads a database built with import_brand_kits.py.
+BRAND_KITS_BACKEND = os.getenv("BRAND_KITS_BACKEND", "json")
+BRAND_KITS_DEFAULT_PATHS = {
+    "json": Path(__file__).parent / "brand_kits" / "database.json",
+    "sqlite": Path(__file__).parent / "data" / "brand_kits.db",
+}
+BRAND_KITS_PATH = Path(os.getenv("BRAND_KITS_PATH", BRAND_KITS_DEFAULT_PATHS.get(BRAND_KITS_BACKEND, "")))
 STATIC_DIR = Path(__file__).parent / "static"
-brand_kits = {}
+# Minimum alias match score (0-1) for a detected logo to be attributed to a brand kit.
+BRAND_MATCH_MIN_SCORE = float(os.getenv("BRAND_MATCH_MIN_SCORE", 0.6))
+# How often (seconds) the brand kit source is checked for changes; 0 disables hot reloading.
+BRAND_KITS_POLL_INTERVAL = float(os.getenv("BRAND_KITS_POLL_INTERVAL", 0.5))
+brand_kit_store = BrandKitStore(create_brand_kit_repository(BRAND_KITS_BACKEND, BRAND_KITS_PATH), min_match_score=BRAND_MATCH_MIN_SCORE, poll_interval=BRAND_KITS_POLL_INTERVAL)
+# Compiled per-brand critique prompt prefixes, keyed by brand kit content hash.
+brand_prompts = BrandPromptCompiler(max_entries=int(os.getenv("BRAND_PROMPT_CACHE_ENTRIES", 256)))
+
+def brand_prompt_for(snapshot: BrandKitSnapshot, brand_key: str) -> BrandPrompt:
+    """The compiled critique prompt for a brand as of the given snapshot."""
+    return brand_prompts.get(brand_key, snapshot.kits[brand_key], snapshot.kit_hashes[brand_key])
+
+# Gemini context caching of the per-brand prompt prefix: "off", "vertex" (Vertex AI cached
+# contents) or "fake" (in-process stand-in for tests). Vertex only caches prompts above a
+# model-specific minimum size; smaller prefixes are sent inline.
+GEMINI_CONTEXT_CACHE = os.getenv("GEMINI_CONTEXT_CACHE", "off")
+GEMINI_CONTEXT_CACHE_TTL_SECONDS = float(os.getenv("GEMINI_CONTEXT_CACHE_TTL_SECONDS", 3600))
+GEMINI_CONTEXT_CACHE_REFRESH_MARGIN_SECONDS = float(os.getenv("GEMINI_CONTEXT_CACHE_REFRESH_MARGIN_SECONDS", 300))
+CONTEXT_CACHE_BACKENDS = {
+    "vertex": lambda: VertexContextCacheBackend(),
+    "fake": lambda: FakeContextCacheBackend(google_clients.gemini_model),
+}
+brand_context_cache = None
+if GEMINI_CONTEXT_CACHE in CONTEXT_CACHE_BACKENDS:
+    brand_context_cache = BrandContextCache(
+        CONTEXT_CACHE_BACKENDS[GEMINI_CONTEXT_CACHE](),
+        ttl_seconds=GEMINI_CONTEXT_CACHE_TTL_SECONDS,
+        refresh_margin_seconds=GEMINI_CONTEXT_CACHE_REFRESH_MARGIN_SECONDS,
+    )
+    brand_kit_store.add_listener(brand_context_cache.sync)
+
+# === EVALUATION CACHE ===
+
+async def run_evaluation_cache(operation, *args):
+    """
+    Runs an evaluation cache operation. With the SQLite tier enabled it reads, writes and
+    evicts on disk, so it runs off the event loop; the memory-only cache is called directly.
+    """
+    if evaluation_cache.disk is None:
+        return operation(*args)
+    return await asyncio.to_thread(operation, *args)
+
+async def get_cached_evaluation(image_digest: str, snapshot: BrandKitSnapshot) -> Optional[dict]:
+    """
+    Returns the cached evaluation for an image digest if its brand kit is unchanged.
+    Entries are keyed on the image digest alone so a hit skips the Vision call too;
+    the stored brand kit hash makes the effective key (image, brand kit content).
+    """
+    entry = await run_evaluation_cache(evaluation_cache.get, image_digest)
+    if entry is None:
+        return None
+    if snapshot.kit_hashes.get(entry["brand_detected"]) != entry["brand_kit_hash"]:
+        await run_evaluation_cache(evaluation_cache.delete, image_digest)
+        return None
+    return entry
+
+async def store_cached_evaluation(image_digest: str, snapshot: BrandKitSnapshot, response_data: dict):
+    """Caches the reusable parts of an evaluation response (everything except the echoed image and timestamp)."""
+    entry = {k: v for k, v in response_data.items() if k not in ("original_image", "timestamp")}
+    entry["brand_kit_hash"] = snapshot.kit_hashes[response_data["brand_detected"]]
+    await run_evaluation_cache(evaluation_cache.set, image_digest, entry)
+
+# === NEAR-DUPLICATE DETECTION ===
+
+async def find_near_duplicate(image_bytes: bytes, snapshot: BrandKitSnapshot) -> tuple:
+    """
+    Fingerprints an upload and looks up the nearest previously evaluated image with matching
+    colors whose evaluation is still cached for the current brand kit. Returns (fingerprint,
+    near_duplicate_of, cached_evaluation), fingerprint being the (image_hash, color_signature)
+    to index the upload under; it is None when detection is off or the image could not be hashed.
+    """
+    if NEAR_DUPLICATE_MODE == "off":
+        return None, None, None
+    try:
+        fingerprint = await asyncio.to_thread(image_fingerprint, image_bytes)
+    except Exception as e:
+        print(f"Warning: Could not compute perceptual hash. Error: {e}")
+        return None, None, None
+    image_hash, color_signature = fingerprint
+    for distance, image_digest in near_duplicate_index.search(image_hash, NEAR_DUPLICATE_MAX_DISTANCE, color_signature, NEAR_DUPLICATE_MAX_COLOR_DELTA_E):
+        cached_evaluation = await get_cached_evaluation(image_digest, snapshot)
+        if cached_evaluation is not None:
+            return fingerprint, {"image_digest": image_digest, "distance": distance}, cached_evaluation
+    return fingerprint, None, None
+
+async def restore_near_duplicate_evaluation(cached_evaluation: dict, near_duplicate_of: dict, original_image: str, image_bytes: bytes, snapshot: BrandKitSnapshot) -> dict:
+    """
+    Rebuilds a response for an upload from its near-duplicate's cached evaluation. Palette
+    compliance is cheap and local, so it is measured on the upload itself rather than reused.
+    """
+    print(f"♻️  Near-duplicate of image {near_duplicate_of['image_digest'][:12]} (distance {near_duplicate_of['distance']}), reusing its critique")
+    response_data = restore_cached_evaluation(cached_evaluation, original_image)
+    brand_kit = snapshot.kits[response_data["brand_detected"]]
+    response_data["vision_analysis"] = await add_palette_compliance(response_data["vision_analysis"], image_bytes, brand_kit)
+    response_data["scorecard"] = score_palette_compliance(response_data["scorecard"], response_data["vision_analysis"]["palette_compliance"])
+    response_data["near_duplicate_of"] = near_duplicate_of
+    return response_data
+
+async def record_fresh_evaluation(image_digest: str, snapshot: BrandKitSnapshot, response_data: dict, fingerprint: Optional[tuple], near_duplicate_of: Optional[dict]):
+    """Caches a freshly computed evaluation, indexes its fingerprint and marks the response as uncached."""
+    await store_cached_evaluation(image_digest, snapshot, response_data)
+    if fingerprint is not None:
+        image_hash, color_signature = fingerprint
+        near_duplicate_index.add(image_hash, image_digest, color_signature)
+    response_data["cached"] = False
+    if near_duplicate_of is not None:
+        response_data["near_duplicate_of"] = near_duplicate_of
+
+# === VISION CACHE ===
+
+async def get_vision_analysis(image_bytes: bytes, image_digest: str) -> dict:
+    """
+    Returns the Vision analysis for an image, calling the Vision API only on a cache miss.
+    """
+    analysis = vision_cache.get(image_digest)
+    if analysis is not None:
+        print(f"⚡ Vision cache hit for image {image_digest[:12]}")
+        return analysis
+    analysis = await run_upstream("vision", analyze_image_with_vision_api, image_bytes)
+    vision_cache.set(image_digest, analysis)
+    return analysis
+
+# === PIPELINED EVALUATION ===
+
+async def run_pipelined_critique(image_bytes: bytes, mime_type: str, image_digest: str, snapshot: BrandKitSnapshot) -> tuple:
+    """
+    Resolves the brand from a logo-only Vision call, then runs the Gemini critique
+    concurrently with the remaining Vision features. Gemini sees the logo result and the
+    palette compliance only, and assesses safety and colors from the image itself.
+    Returns (vision_analysis, brand_key, gemini_response).
+    """
+    print("🔍 Step 1: Detecting logo with Cloud Vision API...")
+    logo_analysis = await run_upstream("vision", analyze_image_with_vision_api, image_bytes, VISION_LOGO_FEATURES)
+    print(f"✅ Logo detection complete. Detected logo: {logo_analysis.get('detected_logo')}")
+
+    print("🔍 Step 2: Determining brand from logo...")
+    detected_brand_name = resolve_brand(logo_analysis, snapshot)
+    print(f"✅ Brand determined: {detected_brand_name}")
+    logo_analysis = await add_palette_compliance(logo_analysis, image_bytes, snapshot.kits[detected_brand_name])
+
+    print("\n🤖 Step 3: Generating critique with Gemini API while Vision finishes safety/color analysis...")
+    detail_analysis, gemini_response = await asyncio.gather(
+        run_upstream("vision", analyze_image_with_vision_api, image_bytes, VISION_DETAIL_FEATURES),
+        run_upstream("gemini", get_critique_and_refinement_with_gemini, image_bytes, brand_prompt_for(snapshot, detected_brand_name), logo_analysis, mime_type),
+    )
+    vision_analysis = dict(detail_analysis, detected_logo=logo_analysis["detected_logo"], detected_logos=logo_analysis["detected_logos"])
+    vision_cache.set(image_digest, vision_analysis)
+    vision_analysis = dict(vision_analysis, palette_compliance=logo_analysis["palette_compliance"])
+    return vision_analysis, detected_brand_name, gemini_response
+
+# === BATCH EVALUATION ===
+
+def list_archive_images(archive: zipfile.ZipFile) -> list:
+    """
+    Returns (filename, zip_info) for every image file in a zip archive without decompressing
+    anything. Entries are size-checked up front so an archive cannot expand past
+    MAX_UPLOAD_BYTES per image or MAX_BATCH_UPLOAD_BYTES in total.
+    """
+    images = []
+    total_bytes = 0
+    for info in archive.infolist():
+        name = info.filename
+        if info.is_dir() or name.startswith("__MACOSX/") or Path(name).name.startswith("."):
+            continue
+        content_type = IMAGE_EXTENSIONS.get(Path(name).suffix.lower())
+        if content_type:
+            total_bytes += info.file_size
+            if info.file_size > MAX_UPLOAD_BYTES:
+                raise HTTPException(status_code=413, detail=f"'{name}' exceeds the maximum image size of {MAX_UPLOAD_BYTES / (1024 * 1024):.1f} MB.")
+            if total_bytes > MAX_BATCH_UPLOAD_BYTES:
+                raise upload_too_large(MAX_BATCH_UPLOAD_BYTES)
+            images.append((name, info))
+    return images
+
+def read_spooled_upload(upload: UploadFile) -> bytes:
+    """Reads an upload's spooled file from the start. Blocking; call it off the event loop."""
+    upload.file.seek(0)
+    return upload.file.read()
+
+def load_batch_window(window: list) -> list:
+    """
+    Reads and hashes a window of batch items, each a (filename, read) pair where read()
+    returns the image bytes. Returns (filename, image_bytes, image_digest) per item, with
+    None bytes and digest for items that could not be read. Blocking; runs in a thread.
+    """
+    loaded = []
+    for filename, read in window:
+        try:
+            image_bytes = read()
+        except Exception as e:
+            print(f"Warning: Could not read batch image '{filename}'. Error: {e}")
+            loaded.append((filename, None, None))
+            continue
+        loaded.append((filename, image_bytes, hashlib.sha256(image_bytes).hexdigest()))
+    return loaded
+
+async def prefetch_batch_vision_analyses(upstream_images: dict):
+    """
+    Fills the vision cache for every uncached image using batch_annotate_images,
+    one VISION_BATCH_LIMIT-sized chunk per Vision worker. upstream_images maps each
+    image digest to its preprocessed (image_bytes, mime_type).
+    """
+    pending = {}
+    for image_digest, (image_bytes, _) in upstream_images.items():
+        if image_digest not in vision_cache:
+            pending[image_digest] = image_bytes
+    pending_digests = list(pending)
+    chunks = [pending_digests[i:i + VISION_BATCH_LIMIT] for i in range(0, len(pending_digests), VISION_BATCH_LIMIT)]
+
+    async def analyze_chunk(chunk):
+        try:
+            analyses = await run_upstream("vision", analyze_images_with_vision_api, [pending[d] for d in chunk])
+        except Exception as e:
+            # Leave the chunk uncached; each image falls back to its own Vision call.
+            print(f"Warning: Batch Vision request failed for {len(chunk)} images. Error: {e}")
+            return
+        for image_digest, analysis in zip(chunk, analyses):
+            vision_cache.set(image_digest, analysis)
+
+    await asyncio.gather(*(analyze_chunk(chunk) for chunk in chunks))
+
+async def evaluate_image_bytes(image_bytes: bytes, image_digest: str, upstream_image: Optional[tuple] = None) -> dict:
+    """
+    Runs the (cache-aware) sequential critique pipeline for one image and returns
+    the /evaluate payload without the echoed image. Brand errors raise HTTPException.
+    upstream_image is the already preprocessed (image_bytes, mime_type), if available.
+    """
+    snapshot = brand_kit_store.snapshot
+    cached_evaluation = await get_cached_evaluation(image_digest, snapshot)
+    if cached_evaluation is not None:
+        return restore_cached_evaluation(cached_evaluation, None)
+    fingerprint, near_duplicate_of, near_duplicate_evaluation = await find_near_duplicate(image_bytes, snapshot)
+    if near_duplicate_evaluation is not None and NEAR_DUPLICATE_MODE == "reuse":
+        return await restore_near_duplicate_evaluation(near_duplicate_evaluation, near_duplicate_of, None, image_bytes, snapshot)
+    upstream_bytes, upstream_mime = upstream_image or await prepare_upstream_image(image_bytes, require_image_type(image_bytes))
+    vision_analysis = await get_vision_analysis(upstream_bytes, image_digest)
+    detected_brand_name = resolve_brand(vision_analysis, snapshot)
+    brand_kit = snapshot.kits[detected_brand_name]
+    vision_analysis = await add_palette_compliance(vision_analysis, upstream_bytes, brand_kit)
+    gemini_response = await run_upstream("gemini", get_critique_and_refinement_with_gemini, upstream_bytes, brand_prompt_for(snapshot, detected_brand_name), vision_analysis, upstream_mime)
+    scorecard, refined_prompt = validate_critique(gemini_response)
+    result = build_evaluation_response(detected_brand_name, brand_kit, None, scorecard, refined_prompt, vision_analysis)
+    await record_fresh_evaluation(image_digest, snapshot, result, fingerprint, near_duplicate_of)
+    return result
+
+async def evaluate_batch_item(filename: str, image_bytes: bytes, image_digest: str, upstream_image: Optional[tuple], semaphore: asyncio.Semaphore) -> dict:
+    """
+    Evaluates one image of a batch. Failures are reported in the result instead of raised.
+    """
+    async with semaphore:
+        try:
+            result = await evaluate_image_bytes(image_bytes, image_digest, upstream_image)
+            result.pop("original_image", None)
+            result.pop("timestamp", None)
+            return {"filename": filename, "image_digest": image_digest, "status": "ok", **result}
+        except HTTPException as e:
+            return {"filename": filename, "image_digest": image_digest, "status": "error", "status_code": e.status_code, "detail": e.detail}
+        except Exception as e:
+            print(f"❌ Error evaluating batch image '{filename}': {e}")
+            return {"filename": filename, "image_digest": image_digest, "status": "error", "status_code": 500, "detail": f"An internal error occurred: {str(e)}"}
+
+SCORECARD_DIMENSIONS = ["brand_alignment", "visual_quality", "message_clarity", "safety_ethics", "palette_compliance"]
+
+def aggregate_campaign_scores(results: list) -> dict:
+    """
+    Summarizes per-image scorecards into campaign-level mean/min/max per dimension.
+    """
+    successful = [r for r in results if r["status"] == "ok"]
+    dimensions = {}
+    for dimension in SCORECARD_DIMENSIONS + ["overall_score"]:
+        scores = []
+        for result in successful:
+            value = result["scorecard"].get(dimension)
+            if isinstance(value, dict):
+                value = value.get("score")
+            if isinstance(value, (int, float)):
+                scores.append(float(value))
+        dimensions[dimension] = {
+            "mean": round(sum(scores) / len(scores), 4) if scores else None,
+            "min": min(scores) if scores else None,
+            "max": max(scores) if scores else None,
+            "count": len(scores),
+        }
+    brands = {}
+    for result in successful:
+        brands[result["brand_detected"]] = brands.get(result["brand_detected"], 0) + 1
+    return {
+        "total_images": len(results),
+        "evaluated": len(successful),
+        "failed": len(results) - len(successful),
+        "cached": sum(1 for r in successful if r.get("cached")),
+        "brands": brands,
+        "dimensions": dimensions,
+    }
+
+# === JOB QUEUE ===
 
-def load_brand_kits():
-    """Load brand kits from JSON file into memory."""
-    global brand_kits
+async def run_evaluate_job(job: dict) -> dict:
+    """Job handler for queued evaluations; the uploaded image is stored as the job blob."""
+    image_bytes = job["blob"]
     try:
-        with open(BRAND_KITS_PATH, "r") as f:
-            brand_kits = json.load(f)
-        print(f"Loaded {len(brand_kits)} brand kits: {list(brand_kits.keys())}")
-    except (FileNotFoundError, json.JSONDecodeError) as e:
-        print(f"Warning: Could not load brand kits from {BRAND_KITS_PATH}. Error: {e}")
-        brand_kits = {}
+        image_digest = job["payload"].get("image_digest") or hashlib.sha256(image_bytes).hexdigest()
+        result = await evaluate_image_bytes(image_bytes, image_digest)
+    except HTTPException as e:
+        raise Exception(e.detail)
+    result.pop("original_image", None)
+    return result
+
+async def run_regenerate_job(job: dict) -> dict:
+    """Job handler for queued Imagen regenerations."""
+    regenerated_image_url = await regenerate_image_url(job["payload"]["refinement_plan"])
+    return {"regenerated_image_url": regenerated_image_url}
+
+JOB_HANDLERS = {
+    "evaluate": run_evaluate_job,
+    "regenerate": run_regenerate_job,
+}
+
+def start_job_workers(count: int):
+    """Start `count` job workers on the running event loop."""
+    job_stop_event.clear()
+    for _ in range(count):
+        job_worker_tasks.append(asyncio.create_task(
+            run_job_worker(job_queue, JOB_HANDLERS, job_stop_event, job_wake_event, JOB_POLL_INTERVAL)
+        ))
+    print(f"Started {count} job workers on {JOB_DB_PATH}")
+
+async def stop_job_workers(grace_seconds: float = 10.0):
+    """
+    Stop the job workers, giving in-flight jobs a grace period. Jobs that are cut off
+    stay 'running' and are picked up again once their lease expires.
+    """
+    job_stop_event.set()
+    job_wake_event.set()
+    if job_worker_tasks:
+        _, pending = await asyncio.wait(job_worker_tasks, timeout=grace_seconds)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+    job_worker_tasks.clear()
+
+async def submit_job(kind: str, payload: dict, blob: Optional[bytes] = None, webhook_url: Optional[str] = None) -> JSONResponse:
+    """
+    Queues a job off the event loop (the insert can wait on another process's lock),
+    wakes local workers and returns the 202 response pointing at the job.
+    """
+    if webhook_url:
+        try:
+            validate_webhook_url(webhook_url, JOB_WEBHOOK_ALLOWED_HOSTS)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    job_id = await asyncio.to_thread(job_queue.submit, kind, payload, blob=blob, webhook_url=webhook_url)
+    job_wake_event.set()
+    print(f"📨 Job {job_id} ({kind}) queued")
+    return JSONResponse(status_code=202, content={
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/jobs/{job_id}",
+        "events_url": f"/jobs/{job_id}/events",
+    })
+
+# === UPSTREAM EXECUTION LAYER ===
+
+class UpstreamRateLimiter:
+    """
+    Spaces out calls to an upstream so they never exceed a requests-per-minute budget.
+    """
+
+    def __init__(self, requests_per_minute: int):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = asyncio.get_running_loop().time()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+upstream_rate_limiters = {upstream: UpstreamRateLimiter(rpm) for upstream, rpm in UPSTREAM_RATE_LIMITS.items()}
+
+def start_upstream_executors():
+    """Create one bounded thread pool per upstream so blocking SDK calls never run on the event loop."""
+    for upstream, max_workers in UPSTREAM_CONCURRENCY.items():
+        if upstream not in upstream_executors:
+            upstream_executors[upstream] = ThreadPoolExecutor(
+                max_workers=max(1, max_workers), thread_name_prefix=f"{upstream}-upstream"
+            )
+    print(f"Upstream executors started: {UPSTREAM_CONCURRENCY}")
+
+def shutdown_upstream_executors():
+    """Shut down the upstream thread pools, waiting for in-flight calls to finish."""
+    for executor in upstream_executors.values():
+        executor.shutdown(wait=True)
+    upstream_executors.clear()
+
+async def run_upstream(upstream: str, func, *args):
+    """
+    Runs a blocking upstream call in that upstream's thread pool and awaits the result.
+    """
+    if upstream not in upstream_executors:
+        start_upstream_executors()
+    await upstream_rate_limiters[upstream].acquire()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(upstream_executors[upstream], func, *args)
+
+async def iterate_upstream(upstream: str, gen_func, *args):
+    """
+    Runs a blocking generator in the upstream's thread pool and yields its items on the event loop.
+    """
+    if upstream not in upstream_executors:
+        start_upstream_executors()
+    await upstream_rate_limiters[upstream].acquire()
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    finished = object()
+
+    def produce():
+        try:
+            for item in gen_func(*args):
+                loop.call_soon_threadsafe(queue.put_nowait, (item, None))
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, (finished, e))
+        else:
+            loop.call_soon_threadsafe(queue.put_nowait, (finished, None))
+
+    producer = loop.run_in_executor(upstream_executors[upstream], produce)
+    while True:
+        item, error = await queue.get()
+        if item is finished:
+            break
+        yield item
+    await producer
+    if error is not None:
+        raise error
 
 # === CORE API FUNCTIONS ===
 
-def analyze_image_with_vision_api(image_bytes: bytes) -> dict:
+VISION_LOGO_FEATURES = [
+    vision.Feature(type_=vision.Feature.Type.LOGO_DETECTION),
+]
+VISION_DETAIL_FEATURES = [
+    vision.Feature(type_=vision.Feature.Type.SAFE_SEARCH_DETECTION),
+    vision.Feature(type_=vision.Feature.Type.IMAGE_PROPERTIES),
+]
+VISION_FEATURES = VISION_LOGO_FEATURES + VISION_DETAIL_FEATURES
+# The Vision API accepts at most 16 images per synchronous batch request.
+VISION_BATCH_LIMIT = 16
+
+def split_vision_features(features: list) -> tuple:
     """
-    Analyzes an image using Google Cloud Vision API for logos, safety, and colors.
+    Returns (features to send to Vision, whether to compute dominant colors locally).
+    With DOMINANT_COLOR_ENGINE=local, IMAGE_PROPERTIES is served in-process instead.
+    """
+    if DOMINANT_COLOR_ENGINE != "local":
+        return features, False
+    remote = [f for f in features if f.type_ != vision.Feature.Type.IMAGE_PROPERTIES]
+    return remote, len(remote) != len(features)
+
+async def add_palette_compliance(vision_analysis: dict, image_bytes: bytes, brand_kit: dict) -> dict:
     """
+    Returns a copy of vision_analysis with the image's palette_compliance against brand_kit,
+    computed off the event loop. The cached Vision analysis itself stays brand-independent.
+    """
+    try:
+        compliance = await asyncio.to_thread(palette_compliance, image_bytes, brand_kit.get("color_palette_hex", []), PALETTE_DELTA_E_THRESHOLD)
+    except Exception as e:
+        print(f"Warning: Could not measure palette compliance. Error: {e}")
+        compliance = None
+    return dict(vision_analysis, palette_compliance=compliance)
+
+def build_vision_request(image_bytes: bytes, features: list = VISION_FEATURES) -> vision.AnnotateImageRequest:
+    """Builds a single multi-feature annotation request for an image."""
+    return vision.AnnotateImageRequest(image=vision.Image(content=image_bytes), features=split_vision_features(features)[0])
+
+def add_local_dominant_colors(analysis: dict, image_bytes: bytes) -> dict:
+    """Fills analysis["dominant_colors"] from the image itself. Colors are advisory, so a failure leaves them empty."""
     try:
-        client = vision.ImageAnnotatorClient()
-        image = vision.Image(content=image_bytes)
-        logo_response = client.logo_detection(image=image)
-        safe_search_response = client.safe_search_detection(image=image)
-        properties_response = client.image_properties(image=image)
-        analysis = {"detected_logo": None, "safety_ratings": {}, "dominant_colors": []}
-        if logo_response.logo_annotations:
-            logo = logo_response.logo_annotations[0]
-            analysis["detected_logo"] = {"description": logo.description, "score": logo.score}
-        if safe_search_response.safe_search_annotation:
-            safety = safe_search_response.safe_search_annotation
-            analysis["safety_ratings"] = {
-                "adult": vision.Likelihood(safety.adult).name, "medical": vision.Likelihood(safety.medical).name,
-                "spoof": vision.Likelihood(safety.spoof).name, "violence": vision.Likelihood(safety.violence).name,
-                "racy": vision.Likelihood(safety.racy).name,
+        analysis["dominant_colors"] = dominant_colors(image_bytes)
+    except Exception as e:
+        print(f"Warning: Could not compute dominant colors locally. Error: {e}")
+    return analysis
+
+def normalized_bounding_box(bounding_poly, size: Optional[tuple]) -> list:
+    """
+    A Vision bounding polygon as fractions (0-1) of the image width and height. Vision gets the
+    downscaled upstream copy, so pixel vertices would not line up with the original upload;
+    normalized ones apply to any size of the image.
+    """
+    if bounding_poly.normalized_vertices:
+        return [{"x": vertex.x, "y": vertex.y} for vertex in bounding_poly.normalized_vertices]
+    if not size:
+        return []
+    width, height = size
+    return [{"x": round(vertex.x / width, 4), "y": round(vertex.y / height, 4)} for vertex in bounding_poly.vertices]
+
+def parse_vision_response(response: vision.AnnotateImageResponse, size: Optional[tuple] = None) -> dict:
+    """
+    Converts a multi-feature Vision annotation response into the analysis dict used by the pipeline.
+    Every logo annotation is kept in detected_logos, highest score first, with its normalized
+    bounding box; detected_logo is the top one. size is the (width, height) of the image sent.
+    """
+    if response.error and response.error.message:
+        raise Exception(response.error.message)
+    analysis = {"detected_logo": None, "detected_logos": [], "safety_ratings": {}, "dominant_colors": []}
+    if response.logo_annotations:
+        logos = [
+            {
+                "description": logo.description,
+                "score": logo.score,
+                "normalized_bounding_box": normalized_bounding_box(logo.bounding_poly, size),
             }
-        if properties_response.image_properties_annotation:
-            props = properties_response.image_properties_annotation
-            if props.dominant_colors and props.dominant_colors.colors:
-                analysis["dominant_colors"] = [{"hex": f"#{int(c.color.red):02x}{int(c.color.green):02x}{int(c.color.blue):02x}", "percent": c.pixel_fraction} for c in props.dominant_colors.colors[:5]]
-        return analysis
+            for logo in response.logo_annotations
+        ]
+        analysis["detected_logos"] = sorted(logos, key=lambda logo: logo["score"], reverse=True)
+        analysis["detected_logo"] = analysis["detected_logos"][0]
+    if response.safe_search_annotation:
+        safety = response.safe_search_annotation
+        analysis["safety_ratings"] = {
+            "adult": vision.Likelihood(safety.adult).name, "medical": vision.Likelihood(safety.medical).name,
+            "spoof": vision.Likelihood(safety.spoof).name, "violence": vision.Likelihood(safety.violence).name,
+            "racy": vision.Likelihood(safety.racy).name,
+        }
+    if response.image_properties_annotation:
+        props = response.image_properties_annotation
+        if props.dominant_colors and props.dominant_colors.colors:
+            analysis["dominant_colors"] = [{"hex": f"#{int(c.color.red):02x}{int(c.color.green):02x}{int(c.color.blue):02x}", "percent": c.pixel_fraction} for c in props.dominant_colors.colors[:5]]
+    return analysis
+
+def analyze_image_with_vision_api(image_bytes: bytes, features: list = VISION_FEATURES) -> dict:
+    """
+    Analyzes an image using Google Cloud Vision API for logos, safety, and colors.
+    All requested features are sent in a single annotate_image call; dominant colors
+    are computed locally instead when DOMINANT_COLOR_ENGINE=local.
+    """
+    try:
+        client = google_clients.vision_client()
+        response = client.annotate_image(request=build_vision_request(image_bytes, features))
+        analysis = parse_vision_response(response, image_size(image_bytes))
+    except Exception as e:
+        print(f"Error calling Google Vision API: {e}")
+        raise Exception(f"Google Cloud Vision API failed: {e}")
+    if split_vision_features(features)[1]:
+        add_local_dominant_colors(analysis, image_bytes)
+    return analysis
+
+def analyze_images_with_vision_api(images: list) -> list:
+    """
+    Analyzes several images with batch_annotate_images, up to VISION_BATCH_LIMIT per request.
+    Returns one analysis dict per image, in order.
+    """
+    try:
+        client = google_clients.vision_client()
+        analyses = []
+        for start in range(0, len(images), VISION_BATCH_LIMIT):
+            chunk = images[start:start + VISION_BATCH_LIMIT]
+            batch_response = client.batch_annotate_images(requests=[build_vision_request(b) for b in chunk])
+            analyses.extend(parse_vision_response(r, image_size(b)) for r, b in zip(batch_response.responses, chunk))
     except Exception as e:
         print(f"Error calling Google Vision API: {e}")
         raise Exception(f"Google Cloud Vision API failed: {e}")
+    if split_vision_features(VISION_FEATURES)[1]:
+        for analysis, image_bytes in zip(analyses, images):
+            add_local_dominant_colors(analysis, image_bytes)
+    return analyses
 
-def get_critique_and_refinement_with_gemini(image_bytes: bytes, brand_kit: dict, vision_analysis: dict) -> dict:
+def resolve_brand(vision_analysis: dict, snapshot: BrandKitSnapshot) -> str:
+    """
+    Maps the detected logos to a key of the snapshot's brand kits, raising a 404 if no supported brand matches.
+    All logos are tried, so a supported brand is found even when it is not the top annotation
+    (co-branded or cluttered ads).
+    """
+    logos = vision_analysis.get("detected_logos")
+    if logos is None:
+        # Analyses cached before every logo annotation was kept only have the top logo.
+        logos = [vision_analysis["detected_logo"]] if vision_analysis.get("detected_logo") else []
+    logos = [logo for logo in logos if logo.get("description")]
+    if not logos:
+        raise HTTPException(
+            status_code=404, 
+            detail="Brand logo could not be detected in the image. Please try another image."
+        )
+
+    candidates = snapshot.index.rank(logos)
+
+    if not candidates:
+        logo_desc = "', '".join(logo["description"] for logo in logos)
+        raise HTTPException(
+            status_code=404,
+            detail=f"Brand '{logo_desc}' was detected but is not supported. Supported brands are: {list(snapshot.kits.keys())}"
+        )
+    best = candidates[0]
+    print(f"✅ Resolved logo '{best['logo_description']}' to brand '{best['brand_key']}' (match score {best['score']}, alias '{best['alias']}')")
+    return best["brand_key"]
+
+CRITIQUE_GENERATION_CONFIG = GenerationConfig(response_mime_type="application/json", temperature=0.7)
+
+def build_critique_request(image_bytes: bytes, brand_prompt: BrandPrompt, vision_analysis: dict, mime_type: str) -> tuple:
+    """
+    Returns (model, contents) for a critique. With a live context cache for the brand, the
+    model carries the prompt prefix and only the image and its analysis are sent.
+    """
+    image_part = Part.from_data(data=image_bytes, mime_type=mime_type)
+    cached_model = brand_context_cache.model_for(brand_prompt) if brand_context_cache is not None else None
+    if cached_model is not None:
+        return cached_model, brand_prompt.image_contents(image_part, vision_analysis)
+    return google_clients.gemini_model(), brand_prompt.contents(image_part, vision_analysis)
+
+def get_critique_and_refinement_with_gemini(image_bytes: bytes, brand_prompt: BrandPrompt, vision_analysis: dict, mime_type: str = "image/jpeg") -> dict:
     """
     Uses Gemini to critique an ad and generate a refinement plan.
     """
     try:
-        model = GenerativeModel("gemini-2.0-flash")
-        brand_name = brand_kit.get("brand_name", "Unknown")
-        prompt = f"""
-        You are a Creative Director and Brand Compliance Officer for '{brand_name}'.
-        Your task is to analyze the provided advertisement image based on the brand guidelines and a pre-analysis from the Google Vision API.
-
-        **1. Brand Guidelines:**
-        - Brand Name: {brand_name}
-        - Official Color Palette (HEX): {", ".join(brand_kit.get("color_palette_hex", []))}
-        - Tone of Voice Keywords: {", ".join(brand_kit.get("tone_of_voice_keywords", []))}
-        - Official Taglines: {", ".join(brand_kit.get("taglines", []))}
-        - Safety Rules: {" ".join(brand_kit.get("safety_rules", []))}
-
-        **2. Google Vision API Pre-Analysis:**
-        - Detected Logo: {vision_analysis.get('detected_logo') or 'None'}
-        - Dominant Colors Found: {[c['hex'] for c in vision_analysis.get('dominant_colors', [])]}
-        - Safety Analysis: {vision_analysis.get('safety_ratings', {})}
-
-        **3. Your Task:**
-        Based on all the information above, analyze the ad image and provide a detailed critique.
-        Evaluate the ad across four dimensions: Brand Alignment, Visual Quality, Message Clarity, and Safety & Ethics.
-        After the critique, generate a new, improved prompt for an image generation model (like Imagen) that would create a better version of this ad, addressing the weaknesses you identified.
-
-        **4. Response Format (Strict JSON only):**
-        Return a single JSON object with the following structure. Do not include any text outside of this JSON object.
-        {{
-          "scorecard": {{
-            "brand_alignment": {{"score": <0-1>, "feedback": "<detailed feedback on logo, color, and tone>"}},
-            "visual_quality": {{"score": <0-1>, "feedback": "<detailed feedback on composition, clarity, and professionalism>"}},
-            "message_clarity": {{"score": <0-1>, "feedback": "<detailed feedback on the ad's message and call-to-action>"}},
-            "safety_ethics": {{"score": <0-1>, "feedback": "<detailed feedback based on the Vision API safety analysis and brand rules>"}},
-            "overall_score": <0-1>,
-            "strengths": ["<list of 2-3 strengths>"],
-            "what_to_improve": ["<list of 3-5 specific, actionable improvements>"]
-          }},
-          "refinement_plan": "<The new, detailed, and improved prompt for the image generation model.>"
-        }}
-        """
-        image_part = Part.from_data(data=image_bytes, mime_type="image/jpeg")
-        generation_config = GenerationConfig(response_mime_type="application/json", temperature=0.7)
-        response = model.generate_content([image_part, prompt], generation_config=generation_config)
+        model, contents = build_critique_request(image_bytes, brand_prompt, vision_analysis, mime_type)
+        response = model.generate_content(contents, generation_config=CRITIQUE_GENERATION_CONFIG)
         return json.loads(response.text)
     except Exception as e:
         print(f"Error calling Gemini API: {e}")
         raise Exception(f"Google Gemini API failed: {e}")
 
-def regenerate_ad_with_imagen(refined_prompt: str) -> str:
+def stream_critique_with_gemini(image_bytes: bytes, brand_prompt: BrandPrompt, vision_analysis: dict, mime_type: str = "image/jpeg"):
+    """
+    Streams the Gemini critique as raw JSON text chunks as they are generated.
+    The concatenated chunks form the same JSON document as get_critique_and_refinement_with_gemini.
+    """
+    try:
+        model, contents = build_critique_request(image_bytes, brand_prompt, vision_analysis, mime_type)
+        for chunk in model.generate_content(contents, generation_config=CRITIQUE_GENERATION_CONFIG, stream=True):
+            if chunk.candidates and chunk.candidates[0].content.parts:
+                yield chunk.text
+    except Exception as e:
+        print(f"Error calling Gemini API: {e}")
+        raise Exception(f"Google Gemini API failed: {e}")
+
+def regenerate_ad_with_imagen(refined_prompt: str) -> bytes:
     """
     Generates a new ad image using the dedicated ImageGenerationModel for Imagen.
-    This is the stable and recommended method for this task.
+    This is the stable and recommended method for this task. Returns the PNG bytes.
     """
     try:
-        # Use the dedicated model class for image generation
-        model = ImageGenerationModel.from_pretrained("imagen-3.0-generate-001")
+        # Use the shared dedicated model class for image generation
+        model = google_clients.imagen_model()
 
         # Call the generate_images method with direct parameters
         # This avoids all the GenerationConfig issues.
@@ -182,10 +905,7 @@ def regenerate_ad_with_imagen(refined_prompt: str) -> str:
             raise Exception("Imagen returned no image candidates.")
 
         # The response object is simpler with this class
-        image_bytes = response.images[0]._image_bytes
-        
-        encoded_string = base64.b64encode(image_bytes).decode('utf-8')
-        return f"data:image/png;base64,{encoded_string}"
+        return response.images[0]._image_bytes
 
     except Exception as e:
         print(f"Error calling Imagen API: {e}")
@@ -193,6 +913,115 @@ def regenerate_ad_with_imagen(refined_prompt: str) -> str:
         raise Exception(f"An internal error occurred: Google Imagen API failed: {e}")
 
 
+def validate_critique(gemini_response: dict) -> tuple:
+    """Extracts (scorecard, refinement_plan) from a Gemini critique, failing if either is missing."""
+    scorecard = gemini_response.get("scorecard")
+    refined_prompt = gemini_response.get("refinement_plan")
+    if not scorecard or not refined_prompt:
+        raise Exception("Gemini response was missing scorecard or refinement_plan.")
+    return scorecard, refined_prompt
+
+def score_palette_compliance(scorecard: dict, compliance: Optional[dict]) -> dict:
+    """Returns scorecard with its palette_compliance entry set from a measured compliance, or removed if there is none."""
+    scorecard = {k: v for k, v in scorecard.items() if k != "palette_compliance"}
+    if compliance:
+        scorecard["palette_compliance"] = {"score": compliance["score"], "feedback": describe_palette_compliance(compliance) + "."}
+    return scorecard
+
+def build_evaluation_response(detected_brand_name: str, brand_kit: dict, original_image: str, scorecard: dict, refined_prompt: str, vision_analysis: dict) -> dict:
+    """Assembles the /evaluate response payload, adding the measured palette compliance to the scorecard."""
+    scorecard = score_palette_compliance(scorecard, vision_analysis.get("palette_compliance"))
+    return {
+        "brand_detected": detected_brand_name,
+        "brand_name": brand_kit.get("brand_name"),
+        "original_image": original_image,
+        "scorecard": scorecard,
+        "refinement_plan": refined_prompt,
+        "timestamp": datetime.now().isoformat(),
+        "vision_analysis": vision_analysis
+    }
+
+def restore_cached_evaluation(cached_evaluation: dict, original_image: str) -> dict:
+    """Rebuilds a full /evaluate response from a cache entry."""
+    response_data = {k: v for k, v in cached_evaluation.items() if k != "brand_kit_hash"}
+    response_data["original_image"] = original_image
+    response_data["timestamp"] = datetime.now().isoformat()
+    response_data["cached"] = True
+    return response_data
+
+def accepted_image_type(image_bytes: bytes) -> Optional[str]:
+    """The sniffed MIME type of an upload if it is one of ACCEPTED_IMAGE_TYPES, else None."""
+    mime_type = sniff_image_type(image_bytes)
+    return mime_type if mime_type in ACCEPTED_IMAGE_TYPES else None
+
+def unsupported_image_type() -> HTTPException:
+    names = ", ".join(IMAGE_TYPES[mime_type][1] for mime_type in ACCEPTED_IMAGE_TYPES)
+    return HTTPException(status_code=415, detail=f"Unsupported or unrecognized image format. Please upload one of: {names}.")
+
+def require_image_type(image_bytes: bytes) -> str:
+    """
+    Sniffs the real image type from the upload's magic bytes, rejecting anything that
+    is not an accepted image before it costs an upstream round trip.
+    """
+    mime_type = accepted_image_type(image_bytes)
+    if mime_type is None:
+        raise unsupported_image_type()
+    return mime_type
+
+async def prepare_upstream_image(image_bytes: bytes, mime_type: str) -> tuple:
+    """
+    Normalizes an upload for Vision and Gemini off the event loop. Returns
+    (image_bytes, mime_type); uploads that cannot be decoded are passed through
+    unchanged when both upstreams accept their type, and rejected with 415 otherwise.
+    """
+    if not UPSTREAM_IMAGE_PREPROCESS and mime_type in UPSTREAM_IMAGE_TYPES:
+        return image_bytes, mime_type
+    try:
+        max_edge = UPSTREAM_IMAGE_MAX_EDGE if UPSTREAM_IMAGE_PREPROCESS else 1 << 16
+        upstream_bytes, upstream_mime = await asyncio.to_thread(
+            normalize_image_for_upstream, image_bytes, max_edge, UPSTREAM_IMAGE_FORMAT, UPSTREAM_IMAGE_QUALITY
+        )
+    except Exception as e:
+        if mime_type not in UPSTREAM_IMAGE_TYPES:
+            print(f"Warning: Could not decode {mime_type} image. Error: {e}")
+            raise HTTPException(status_code=415, detail=f"The {IMAGE_TYPES[mime_type][1]} image could not be decoded.")
+        print(f"Warning: Could not preprocess image, sending original bytes. Error: {e}")
+        return image_bytes, mime_type
+    if len(upstream_bytes) != len(image_bytes):
+        print(f"🗜️  Preprocessed image for upstream: {len(image_bytes)} -> {len(upstream_bytes)} bytes")
+    return upstream_bytes, upstream_mime
+
+def original_image_reference(image_bytes: bytes, content_type: str, image_digest: str) -> str:
+    """
+    Returns how the uploaded image is echoed in the response: a data URL in "inline"
+    mode, or a short /blobs URL to the stored upload in "url" mode. Blocking (it may
+    write the upload to the blob store); call it off the event loop.
+    """
+    if EVALUATION_IMAGE_MODE == "url":
+        blob_store.put(image_bytes, content_type, digest=image_digest)
+        return f"/blobs/{image_digest}"
+    return f"data:{content_type};base64,{base64.b64encode(image_bytes).decode('utf-8')}"
+
+def store_regenerated_image(image_bytes: bytes) -> str:
+    """
+    Transcodes Imagen output to REGENERATED_IMAGE_FORMAT and returns either a /blobs URL
+    ("url" mode) or a data URL ("inline" mode).
+    """
+    image_bytes, content_type = transcode_image(image_bytes, REGENERATED_IMAGE_FORMAT)
+    if REGENERATED_IMAGE_MODE == "url":
+        return f"/blobs/{blob_store.put(image_bytes, content_type)}"
+    return f"data:{content_type};base64,{base64.b64encode(image_bytes).decode('utf-8')}"
+
+async def regenerate_image_url(refinement_plan: str) -> str:
+    """Runs Imagen for a refinement plan and returns the URL of the stored result."""
+    image_bytes = await run_upstream("imagen", regenerate_ad_with_imagen, refinement_plan)
+    return await asyncio.to_thread(store_regenerated_image, image_bytes)
+
+def sse_event(event: str, data) -> str:
+    """Formats a single Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
 # === MAIN API ENDPOINTS ===
 
 @app.get("/")
@@ -200,6 +1029,139 @@ async def root():
     """Serve main HTML file."""
     return FileResponse(STATIC_DIR / "index.html")
 
+@app.get("/health")
+async def health():
+    """Report readiness of the shared Google clients and loaded brand kits."""
+    client_health = google_clients.health()
+    job_stats = await asyncio.to_thread(job_queue.stats)
+    return JSONResponse(content={
+        "status": client_health["status"],
+        "clients": client_health["clients"],
+        "brand_kits_loaded": len(brand_kit_store.snapshot.kits),
+        "brand_kits": brand_kit_store.stats(),
+        "context_cache": brand_context_cache.stats() if brand_context_cache is not None else {"enabled": False},
+        "evaluation_cache": evaluation_cache.stats(),
+        "vision_cache": vision_cache.stats(),
+        "near_duplicates": dict(near_duplicate_index.stats(), mode=NEAR_DUPLICATE_MODE),
+        "jobs": job_stats,
+        "timestamp": datetime.now().isoformat(),
+    })
+
+@app.delete("/cache/vision")
+async def clear_vision_cache():
+    """Drop every cached Vision analysis."""
+    vision_cache.clear()
+    return JSONResponse(content={"cleared": True, "vision_cache": vision_cache.stats()})
+
+@app.delete("/cache/vision/{image_digest}")
+async def invalidate_vision_cache_entry(image_digest: str):
+    """Drop the cached Vision analysis for a single image digest (SHA-256 hex)."""
+    vision_cache.delete(image_digest)
+    return JSONResponse(content={"invalidated": image_digest, "vision_cache": vision_cache.stats()})
+
+# --- Brand Kit API ---
+BRAND_KIT_KEY_PATTERN = re.compile(r"^[a-z0-9][a-z0-9_-]{0,63}$")
+
+class BrandKit(BaseModel):
+    """Body of PUT /brand-kits/{key}. Fields beyond these are stored as given; "version" is set by the server."""
+    model_config = ConfigDict(extra="allow")
+
+    brand_name: str
+    aliases: List[str] = []
+    official_logos: List[str] = []
+    color_palette_hex: List[str] = []
+    typography: List[str] = []
+    tone_of_voice_keywords: List[str] = []
+    taglines: List[str] = []
+    safety_rules: List[str] = []
+
+def brand_kit_etag(snapshot: BrandKitSnapshot, key: str) -> str:
+    """Strong ETag for a kit: its content hash, which changes with every write (the version is part of the kit)."""
+    return f'"{snapshot.kit_hashes[key]}"'
+
+def expected_brand_kit_hash(request: Request, snapshot: BrandKitSnapshot, key: str) -> Optional[str]:
+    """The kit hash a write is conditional on, from If-Match ("*" means the kit must exist)."""
+    if_match = request.headers.get("if-match")
+    if if_match is None:
+        return None
+    if if_match.strip() == "*":
+        return snapshot.kit_hashes.get(key, "")
+    return if_match.strip().removeprefix("W/").strip('"')
+
+def require_brand_kit_key(key: str):
+    if not BRAND_KIT_KEY_PATTERN.match(key):
+        raise HTTPException(status_code=422, detail="Brand kit keys must be 1-64 lowercase letters, digits, '-' or '_'.")
+
+def brand_kit_write_failed(error: BrandKitWriteError) -> HTTPException:
+    """503 for a kit write the brand kit source rejected (e.g. a corrupt catalog file); the kits in memory are unchanged."""
+    print(f"❌ {error}")
+    return HTTPException(status_code=503, detail=f"{error}. Brand kits are unchanged; fix the brand kit source and retry.")
+
+def brand_kit_response(snapshot: BrandKitSnapshot, key: str, status_code: int = 200) -> JSONResponse:
+    return JSONResponse(
+        status_code=status_code,
+        content={"key": key, "brand_kit": snapshot.kits[key], "brand_kits_version": snapshot.version},
+        headers={"ETag": brand_kit_etag(snapshot, key), "Cache-Control": "no-cache"},
+    )
+
+@app.get("/brand-kits")
+async def list_brand_kits():
+    """List the loaded brand kits with their ETags."""
+    snapshot = brand_kit_store.snapshot
+    return JSONResponse(content={
+        "brand_kits_version": snapshot.version,
+        "brand_kits": [
+            {"key": key, "brand_name": snapshot.index_entries[key].get("brand_name"), "etag": brand_kit_etag(snapshot, key)}
+            for key in snapshot.kit_hashes
+        ],
+    })
+
+@app.get("/brand-kits/{key}")
+async def get_brand_kit(key: str, request: Request):
+    """Return one brand kit. Send If-None-Match with a previous ETag to get 304 when it is unchanged."""
+    snapshot = brand_kit_store.snapshot
+    if key not in snapshot.kit_hashes:
+        raise HTTPException(status_code=404, detail=f"Brand kit '{key}' not found.")
+    etag = brand_kit_etag(snapshot, key)
+    if request.headers.get("if-none-match") in (etag, etag.strip('"'), "*"):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    return brand_kit_response(snapshot, key)
+
+@app.put("/brand-kits/{key}")
+async def put_brand_kit(key: str, brand_kit: BrandKit, request: Request):
+    """
+    Create or replace a brand kit. The change is written to the brand kit source atomically
+    and applied to the in-memory kits immediately; the kit's "version" is incremented.
+    Send If-Match with the kit's ETag to avoid overwriting a concurrent change (412).
+    """
+    require_brand_kit_key(key)
+    snapshot = brand_kit_store.snapshot
+    created = key not in snapshot.kit_hashes
+    try:
+        snapshot = await asyncio.to_thread(brand_kit_store.save_kit, key, brand_kit.model_dump(), expected_brand_kit_hash(request, snapshot, key))
+    except BrandKitConflict:
+        raise HTTPException(status_code=412, detail=f"Brand kit '{key}' was modified; fetch it again and retry.")
+    except BrandKitWriteError as e:
+        raise brand_kit_write_failed(e)
+    print(f"🏷️  Brand kit '{key}' saved (version {snapshot.kits[key]['version']})")
+    return brand_kit_response(snapshot, key, status_code=201 if created else 200)
+
+@app.delete("/brand-kits/{key}")
+async def delete_brand_kit(key: str, request: Request):
+    """Delete a brand kit. Supports If-Match like PUT."""
+    require_brand_kit_key(key)
+    snapshot = brand_kit_store.snapshot
+    try:
+        await asyncio.to_thread(brand_kit_store.delete_kit, key, expected_brand_kit_hash(request, snapshot, key))
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Brand kit '{key}' not found.")
+    except BrandKitConflict:
+        raise HTTPException(status_code=412, detail=f"Brand kit '{key}' was modified; fetch it again and retry.")
+    except BrandKitWriteError as e:
+        raise brand_kit_write_failed(e)
+    print(f"🏷️  Brand kit '{key}' deleted")
+    return Response(status_code=204)
+
 @app.post("/evaluate")
 async def evaluate(image: UploadFile = File(...)):
     """
@@ -210,86 +1172,206 @@ async def evaluate(image: UploadFile = File(...)):
     print(f"📎 Image: {image.filename}, Type: {image.content_type}")
     print("="*60 + "\n")
 
+    image_bytes, image_digest = await read_upload(image, MAX_UPLOAD_BYTES)
+    mime_type = require_image_type(image_bytes)
+
     try:
-        image_bytes = await image.read()
-
-        # --- Step 1: Analyze image with Vision API ---
-        print("🔍 Step 1: Analyzing image with Cloud Vision API...")
-        vision_analysis = analyze_image_with_vision_api(image_bytes)
-        print(f"✅ Vision API analysis complete. Detected logo: {vision_analysis.get('detected_logo')}")
-
-        # --- Step 2: Determine Brand ---
-        print("🔍 Step 2: Determining brand from logo...")
-        logo_analysis = vision_analysis.get("detected_logo")
-        if not logo_analysis or not logo_analysis.get("description"):
-            raise HTTPException(
-                status_code=404, 
-                detail="Brand logo could not be detected in the image. Please try another image."
-            )
+        original_image = await asyncio.to_thread(original_image_reference, image_bytes, mime_type, image_digest)
+        snapshot = brand_kit_store.snapshot
 
-        logo_desc = logo_analysis["description"]
-        detected_brand_name = None
-        
-        # Improved Matching Logic
-        logo_words = logo_desc.lower().replace('-', ' ').split()
-
-        for brand_key in brand_kits:
-            # Check if the brand key (e.g., "cocacola") is in the logo description (e.g., "the coca-cola company")
-            # This handles cases where the key has no spaces/hyphens.
-            if brand_key in logo_desc.lower().replace('-', '').replace(' ', ''):
-                detected_brand_name = brand_key
-                break
-            
-            # Check if any significant word from the logo description is in the brand key
-            if not detected_brand_name:
-                for word in logo_words:
-                    if len(word) > 2 and word in brand_key:
-                        detected_brand_name = brand_key
-                        break
-            if detected_brand_name:
-                break
-
-        if not detected_brand_name:
-            raise HTTPException(
-                status_code=404,
-                detail=f"Brand '{logo_desc}' was detected but is not supported. Supported brands are: {list(brand_kits.keys())}"
-            )
-        
-        brand_kit = brand_kits.get(detected_brand_name)
-        print(f"✅ Brand determined: {detected_brand_name}")
-
-        # --- Step 3: Get Critique & Refinement from Gemini ---
-        print("\n🤖 Step 3: Generating critique with Gemini API...")
-        gemini_response = get_critique_and_refinement_with_gemini(image_bytes, brand_kit, vision_analysis)
-        scorecard = gemini_response.get("scorecard")
-        refined_prompt = gemini_response.get("refinement_plan")
-        if not scorecard or not refined_prompt:
-            raise Exception("Gemini response was missing scorecard or refinement_plan.")
+        # --- Step 0: Serve repeat uploads from the evaluation cache ---
+        cached_evaluation = await get_cached_evaluation(image_digest, snapshot)
+        if cached_evaluation is not None:
+            print(f"⚡ Cache hit for image {image_digest[:12]} (brand: {cached_evaluation['brand_detected']})")
+            response_data = restore_cached_evaluation(cached_evaluation, original_image)
+            return JSONResponse(content=response_data)
+        fingerprint, near_duplicate_of, near_duplicate_evaluation = await find_near_duplicate(image_bytes, snapshot)
+        if near_duplicate_evaluation is not None and NEAR_DUPLICATE_MODE == "reuse":
+            response_data = await restore_near_duplicate_evaluation(near_duplicate_evaluation, near_duplicate_of, original_image, image_bytes, snapshot)
+            return JSONResponse(content=response_data)
+
+        upstream_bytes, upstream_mime = await prepare_upstream_image(image_bytes, mime_type)
+        if EVALUATION_PIPELINE_MODE == "pipelined" and image_digest not in vision_cache:
+            vision_analysis, detected_brand_name, gemini_response = await run_pipelined_critique(upstream_bytes, upstream_mime, image_digest, snapshot)
+        else:
+            # --- Step 1: Analyze image with Vision API ---
+            print("🔍 Step 1: Analyzing image with Cloud Vision API...")
+            vision_analysis = await get_vision_analysis(upstream_bytes, image_digest)
+            print(f"✅ Vision API analysis complete. Detected logo: {vision_analysis.get('detected_logo')}")
+
+            # --- Step 2: Determine Brand ---
+            print("🔍 Step 2: Determining brand from logo...")
+            detected_brand_name = resolve_brand(vision_analysis, snapshot)
+            print(f"✅ Brand determined: {detected_brand_name}")
+            vision_analysis = await add_palette_compliance(vision_analysis, upstream_bytes, snapshot.kits[detected_brand_name])
+
+            # --- Step 3: Get Critique & Refinement from Gemini ---
+            print("\n🤖 Step 3: Generating critique with Gemini API...")
+            gemini_response = await run_upstream("gemini", get_critique_and_refinement_with_gemini, upstream_bytes, brand_prompt_for(snapshot, detected_brand_name), vision_analysis, upstream_mime)
+
+        scorecard, refined_prompt = validate_critique(gemini_response)
         print(f"✅ Gemini critique complete. Overall score: {scorecard.get('overall_score', 'N/A')}")
 
         # --- Step 4: Assemble and Return Response ---
-        original_image_base64 = base64.b64encode(image_bytes).decode('utf-8')
-        response_data = {
-            "brand_detected": detected_brand_name,
-            "brand_name": brand_kit.get("brand_name"),
-            "original_image": f"data:{image.content_type};base64,{original_image_base64}",
-            "scorecard": scorecard,
-            "refinement_plan": refined_prompt,
-            "timestamp": datetime.now().isoformat(),
-            "vision_analysis": vision_analysis
-        }
-        
+        response_data = build_evaluation_response(
+            detected_brand_name, snapshot.kits[detected_brand_name], original_image,
+            scorecard, refined_prompt, vision_analysis,
+        )
+        await record_fresh_evaluation(image_digest, snapshot, response_data, fingerprint, near_duplicate_of)
+
         print("\n" + "="*60)
         print("✅ EVALUATION COMPLETE - Sending response")
         print("="*60)
         return JSONResponse(content=response_data)
 
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         print(f"❌ Error in /evaluate workflow: {e}")
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"An internal error occurred: {str(e)}")
 
+@app.post("/evaluate/stream")
+async def evaluate_stream(image: UploadFile = File(...)):
+    """
+    Streaming variant of /evaluate that emits Server-Sent Events as each stage completes:
+    vision_analysis, brand_detected, critique_chunk (raw Gemini tokens), scorecard,
+    refinement_plan and finally complete (the full /evaluate payload) or error.
+    """
+    print("\n" + "="*60)
+    print("📥 NEW STREAMING EVALUATION REQUEST RECEIVED")
+    print(f"📎 Image: {image.filename}, Type: {image.content_type}")
+    print("="*60 + "\n")
+
+    image_bytes, image_digest = await read_upload(image, MAX_UPLOAD_BYTES)
+    mime_type = require_image_type(image_bytes)
+
+    async def event_stream():
+        try:
+            original_image = await asyncio.to_thread(original_image_reference, image_bytes, mime_type, image_digest)
+            snapshot = brand_kit_store.snapshot
+
+            cached_evaluation = await get_cached_evaluation(image_digest, snapshot)
+            fingerprint = near_duplicate_of = None
+            if cached_evaluation is not None:
+                print(f"⚡ Cache hit for image {image_digest[:12]} (brand: {cached_evaluation['brand_detected']})")
+                response_data = restore_cached_evaluation(cached_evaluation, original_image)
+            else:
+                fingerprint, near_duplicate_of, near_duplicate_evaluation = await find_near_duplicate(image_bytes, snapshot)
+                response_data = None
+                if near_duplicate_evaluation is not None and NEAR_DUPLICATE_MODE == "reuse":
+                    response_data = await restore_near_duplicate_evaluation(near_duplicate_evaluation, near_duplicate_of, original_image, image_bytes, snapshot)
+            if response_data is not None:
+                yield sse_event("vision_analysis", response_data["vision_analysis"])
+                yield sse_event("brand_detected", {"brand_detected": response_data["brand_detected"], "brand_name": response_data["brand_name"]})
+                yield sse_event("scorecard", response_data["scorecard"])
+                yield sse_event("refinement_plan", {"refinement_plan": response_data["refinement_plan"]})
+                yield sse_event("complete", response_data)
+                return
+
+            upstream_bytes, upstream_mime = await prepare_upstream_image(image_bytes, mime_type)
+            vision_analysis = await get_vision_analysis(upstream_bytes, image_digest)
+            yield sse_event("vision_analysis", vision_analysis)
+
+            detected_brand_name = resolve_brand(vision_analysis, snapshot)
+            brand_kit = snapshot.kits[detected_brand_name]
+            yield sse_event("brand_detected", {"brand_detected": detected_brand_name, "brand_name": brand_kit.get("brand_name")})
+            vision_analysis = await add_palette_compliance(vision_analysis, upstream_bytes, brand_kit)
+
+            chunks = []
+            async for chunk in iterate_upstream("gemini", stream_critique_with_gemini, upstream_bytes, brand_prompt_for(snapshot, detected_brand_name), vision_analysis, upstream_mime):
+                chunks.append(chunk)
+                yield sse_event("critique_chunk", {"text": chunk})
+            scorecard, refined_prompt = validate_critique(json.loads("".join(chunks)))
+            response_data = build_evaluation_response(detected_brand_name, brand_kit, original_image, scorecard, refined_prompt, vision_analysis)
+            yield sse_event("scorecard", response_data["scorecard"])
+            yield sse_event("refinement_plan", {"refinement_plan": refined_prompt})
+
+            await record_fresh_evaluation(image_digest, snapshot, response_data, fingerprint, near_duplicate_of)
+            print("✅ STREAMING EVALUATION COMPLETE")
+            yield sse_event("complete", response_data)
+
+        except HTTPException as e:
+            yield sse_event("error", {"status_code": e.status_code, "detail": e.detail})
+        except Exception as e:
+            import traceback
+            print(f"❌ Error in /evaluate/stream workflow: {e}")
+            print(traceback.format_exc())
+            yield sse_event("error", {"status_code": 500, "detail": f"An internal error occurred: {str(e)}"})
+
+    return StreamingResponse(
+        event_stream(), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/evaluate/batch")
+async def evaluate_batch(images: List[UploadFile] = File(None), archive: Optional[UploadFile] = File(None)):
+    """
+    Evaluates a whole campaign: many `images` in one multipart request and/or a zip `archive`.
+    Returns per-image results (without the echoed image) and a campaign-level aggregate.
+    """
+    print("\n" + "="*60)
+    print("📥 NEW BATCH EVALUATION REQUEST RECEIVED")
+    print("="*60 + "\n")
+
+    if images and len(images) > BATCH_MAX_IMAGES:
+        raise HTTPException(status_code=413, detail=f"Batch contains {len(images)} images; the maximum is {BATCH_MAX_IMAGES}.")
+    # Items are read lazily from the spooled request files, never all at once.
+    batch = []
+    zip_archive = None
+    for upload in images or []:
+        if upload.size is not None and upload.size > MAX_UPLOAD_BYTES:
+            raise upload_too_large(MAX_UPLOAD_BYTES)
+        batch.append((upload.filename, functools.partial(read_spooled_upload, upload)))
+    try:
+        if archive is not None:
+            try:
+                zip_archive = await asyncio.to_thread(zipfile.ZipFile, archive.file)
+            except zipfile.BadZipFile:
+                raise HTTPException(status_code=400, detail=f"'{archive.filename}' is not a valid zip archive.")
+            batch.extend((name, functools.partial(zip_archive.read, info)) for name, info in list_archive_images(zip_archive))
+        if not batch:
+            raise HTTPException(status_code=400, detail="No images were provided. Upload 'images' files or a zip 'archive'.")
+        if len(batch) > BATCH_MAX_IMAGES:
+            raise HTTPException(status_code=413, detail=f"Batch contains {len(batch)} images; the maximum is {BATCH_MAX_IMAGES}.")
+
+        print(f"📦 Evaluating {len(batch)} images...")
+        semaphore = asyncio.Semaphore(max(1, BATCH_MAX_CONCURRENCY))
+        # Identical creatives in a campaign are evaluated once and share the result.
+        outcomes = {}
+        results = []
+        for start in range(0, len(batch), max(1, BATCH_WINDOW_SIZE)):
+            loaded = await asyncio.to_thread(load_batch_window, batch[start:start + max(1, BATCH_WINDOW_SIZE)])
+            unique_images = {}
+            for filename, image_bytes, image_digest in loaded:
+                if image_digest is not None and image_digest not in outcomes:
+                    unique_images.setdefault(image_digest, (filename, image_bytes))
+            # Unrecognized files are left out here and reported as 415 errors per image.
+            mime_types = {image_digest: accepted_image_type(image_bytes) for image_digest, (_, image_bytes) in unique_images.items()}
+            supported = [image_digest for image_digest in unique_images if mime_types[image_digest]]
+            prepared = await asyncio.gather(*(prepare_upstream_image(unique_images[d][1], mime_types[d]) for d in supported), return_exceptions=True)
+            # Images that failed to decode are retried by evaluate_batch_item, which reports the error.
+            upstream_images = {d: p for d, p in zip(supported, prepared) if not isinstance(p, BaseException)}
+            await prefetch_batch_vision_analyses(upstream_images)
+
+            evaluations = {
+                image_digest: evaluate_batch_item(filename, image_bytes, image_digest, upstream_images.get(image_digest), semaphore)
+                for image_digest, (filename, image_bytes) in unique_images.items()
+            }
+            outcomes.update(zip(evaluations, await asyncio.gather(*evaluations.values())))
+            for filename, _, image_digest in loaded:
+                if image_digest is None:
+                    results.append({"filename": filename, "image_digest": None, "status": "error", "status_code": 400, "detail": f"'{filename}' could not be read."})
+                else:
+                    results.append(dict(outcomes[image_digest], filename=filename))
+    finally:
+        if zip_archive is not None:
+            zip_archive.close()
+    campaign = aggregate_campaign_scores(results)
+    print(f"✅ BATCH EVALUATION COMPLETE - {campaign['evaluated']}/{campaign['total_images']} images evaluated")
+    return JSONResponse(content={"campaign": campaign, "results": results, "timestamp": datetime.now().isoformat()})
+
 @app.post("/regenerate")
 async def regenerate(request: RegenerationRequest):
     """
@@ -299,7 +1381,7 @@ async def regenerate(request: RegenerationRequest):
     print("🎨 NEW REGENERATION REQUEST RECEIVED")
     print("="*60 + "\n")
     try:
-        regenerated_image_url = regenerate_ad_with_imagen(request.refinement_plan)
+        regenerated_image_url = await regenerate_image_url(request.refinement_plan)
         print("✅ Imagen regeneration complete.")
         return JSONResponse(content={"regenerated_image_url": regenerated_image_url})
     except Exception as e:
@@ -308,6 +1390,87 @@ async def regenerate(request: RegenerationRequest):
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"An internal error occurred: {str(e)}")
 
+@app.get("/blobs/{digest}")
+async def get_blob(digest: str, request: Request):
+    """
+    Streams a stored blob. Blobs are content-addressed and therefore immutable, so the
+    digest doubles as a strong ETag and responses may be cached indefinitely.
+    """
+    meta = blob_store.metadata(digest)
+    if meta is None:
+        raise HTTPException(status_code=404, detail=f"Blob '{digest}' not found.")
+    headers = {
+        "ETag": f'"{digest}"',
+        "Cache-Control": f"public, max-age={BLOB_CACHE_MAX_AGE}, immutable",
+    }
+    if request.headers.get("if-none-match") in (f'"{digest}"', digest, "*"):
+        return Response(status_code=304, headers=headers)
+    headers["Content-Length"] = str(meta["size"])
+    return StreamingResponse(blob_store.iter_chunks(digest), media_type=meta["content_type"], headers=headers)
+
+class RegenerationJobRequest(BaseModel):
+    refinement_plan: str
+    webhook_url: Optional[str] = None
+
+@app.post("/jobs/evaluate", status_code=202)
+async def submit_evaluate_job(image: UploadFile = File(...), webhook_url: Optional[str] = Form(None)):
+    """
+    Queues an evaluation and returns a job id immediately. Poll /jobs/{job_id},
+    follow /jobs/{job_id}/events, or pass webhook_url to be notified on completion.
+    """
+    image_bytes, image_digest = await read_upload(image, MAX_UPLOAD_BYTES)
+    mime_type = require_image_type(image_bytes)
+    payload = {"filename": image.filename, "content_type": mime_type, "image_digest": image_digest}
+    return await submit_job("evaluate", payload, blob=image_bytes, webhook_url=webhook_url)
+
+@app.post("/jobs/regenerate", status_code=202)
+async def submit_regenerate_job(request: RegenerationJobRequest):
+    """
+    Queues an Imagen regeneration and returns a job id immediately.
+    """
+    return await submit_job("regenerate", {"refinement_plan": request.refinement_plan}, webhook_url=request.webhook_url)
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Return the status of a job, with its result once it has succeeded."""
+    job = await asyncio.to_thread(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found.")
+    return JSONResponse(content=public_job_view(job))
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """
+    Server-Sent Events for a job: a status event on every change, then complete or failed.
+    A job that is purged while the stream is open ends it with a gone event.
+    """
+    job = await asyncio.to_thread(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found.")
+
+    async def event_stream():
+        last_status = None
+        while True:
+            job = await asyncio.to_thread(job_queue.get, job_id)
+            if job is None:
+                yield sse_event("gone", {"job_id": job_id, "detail": f"Job '{job_id}' no longer exists."})
+                return
+            if job["status"] != last_status:
+                last_status = job["status"]
+                yield sse_event("status", {"job_id": job_id, "status": last_status})
+            if last_status == "succeeded":
+                yield sse_event("complete", public_job_view(job))
+                return
+            if last_status == "failed":
+                yield sse_event("failed", public_job_view(job))
+                return
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+
+    return StreamingResponse(
+        event_stream(), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 
 # Mount static files for the frontend
 app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
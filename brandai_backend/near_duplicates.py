@@ -0,0 +1,165 @@
+import io
+import threading
+from collections import deque
+from typing import Optional
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from color_analysis import rgb_to_lab
+from image_processing import flatten_onto_white
+
+# pHash: the top-left HASH_SIZE x HASH_SIZE DCT coefficients of a HASH_IMAGE_SIZE grayscale thumbnail.
+HASH_SIZE = 8
+HASH_IMAGE_SIZE = 32
+
+# The pHash ignores color, so entries also keep the mean Lab color of each cell of a
+# COLOR_GRID_SIZE x COLOR_GRID_SIZE grid. Recompression, resizing and small crops move a
+# cell by a few Delta-E; recoloring a logo or swapping channels moves some cell by far more.
+COLOR_GRID_SIZE = 4
+DEFAULT_MAX_COLOR_DISTANCE = 10.0
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    """Orthonormal DCT-II matrix, so the 2-D transform of X is D @ X @ D.T."""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix.astype(np.float32)
+
+
+_DCT = _dct_matrix(HASH_IMAGE_SIZE)
+
+
+def image_fingerprint(image_bytes: bytes) -> tuple:
+    """
+    Decodes an image once and returns (image_hash, color_signature): its 64-bit pHash and
+    the (COLOR_GRID_SIZE ** 2, 3) array of mean Lab colors per grid cell. Re-exports,
+    recompression and resizing change only a few hash bits and little of the signature.
+    """
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        image.draft("RGB", (HASH_IMAGE_SIZE * 4, HASH_IMAGE_SIZE * 4))
+        image = flatten_onto_white(ImageOps.exif_transpose(image)).convert("RGB")
+        gray = image.convert("L").resize((HASH_IMAGE_SIZE, HASH_IMAGE_SIZE), Image.Resampling.LANCZOS)
+        cells = image.resize((COLOR_GRID_SIZE, COLOR_GRID_SIZE), Image.Resampling.BOX)
+    pixels = np.asarray(gray, dtype=np.float32)
+    low_frequencies = (_DCT @ pixels @ _DCT.T)[:HASH_SIZE, :HASH_SIZE].flatten()
+    # The DC term only reflects overall brightness, so it is left out of the median.
+    bits = low_frequencies > np.median(low_frequencies[1:])
+    image_hash = int.from_bytes(np.packbits(bits).tobytes(), "big")
+    return image_hash, rgb_to_lab(np.asarray(cells, dtype=np.float32).reshape(-1, 3))
+
+
+def perceptual_hash(image_bytes: bytes) -> int:
+    """64-bit pHash of an image; visually near-identical images are a small Hamming distance apart."""
+    return image_fingerprint(image_bytes)[0]
+
+
+def color_distance(a: np.ndarray, b: np.ndarray) -> float:
+    """Largest Delta-E (CIE76) between corresponding cells of two color signatures."""
+    return float(np.sqrt(((a - b) ** 2).sum(axis=1)).max())
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over integer hashes with Hamming distance. A radius search only
+    descends into children whose edge distance is within radius of the query's distance
+    to the node, which prunes most of the tree for small radii.
+    """
+
+    def __init__(self):
+        self._root = None
+        self._size = 0
+
+    def add(self, image_hash: int, value):
+        node = [image_hash, [value], {}]
+        if self._root is None:
+            self._root = node
+            self._size = 1
+            return
+        current = self._root
+        while True:
+            distance = hamming_distance(image_hash, current[0])
+            if distance == 0:
+                current[1].append(value)
+                self._size += 1
+                return
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                self._size += 1
+                return
+            current = child
+
+    def search(self, image_hash: int, radius: int) -> list:
+        """Returns [(distance, value)] for every entry within radius, nearest first."""
+        if self._root is None:
+            return []
+        matches = []
+        pending = [self._root]
+        while pending:
+            node_hash, values, children = pending.pop()
+            distance = hamming_distance(image_hash, node_hash)
+            if distance <= radius:
+                matches.extend((distance, value) for value in values)
+            for edge, child in children.items():
+                if distance - radius <= edge <= distance + radius:
+                    pending.append(child)
+        matches.sort(key=lambda match: match[0])
+        return matches
+
+    def __len__(self):
+        return self._size
+
+
+class NearDuplicateIndex:
+    """
+    Perceptual hashes of evaluated images, mapped to their image digests, with each image's
+    color signature. Holds at most max_entries; BK-trees cannot delete, so once full the
+    tree is rebuilt from the newest half of the entries.
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._tree = BKTree()
+        self._entries = deque()
+        self._colors = {}
+        self._lock = threading.Lock()
+
+    def add(self, image_hash: int, image_digest: str, color_signature: np.ndarray):
+        with self._lock:
+            if image_digest in self._colors:
+                return
+            if len(self._entries) >= self.max_entries:
+                for _ in range(len(self._entries) - self.max_entries // 2):
+                    self._colors.pop(self._entries.popleft()[1], None)
+                self._tree = BKTree()
+                for entry_hash, entry_digest in self._entries:
+                    self._tree.add(entry_hash, entry_digest)
+            self._entries.append((image_hash, image_digest))
+            self._colors[image_digest] = color_signature
+            self._tree.add(image_hash, image_digest)
+
+    def search(self, image_hash: int, max_distance: int, color_signature: Optional[np.ndarray] = None, max_color_distance: float = DEFAULT_MAX_COLOR_DISTANCE) -> list:
+        """
+        Returns [(distance, image_digest)] within max_distance bits, nearest first. With a
+        color_signature, entries whose colors differ by more than max_color_distance are left out.
+        """
+        with self._lock:
+            matches = self._tree.search(image_hash, max_distance)
+            if color_signature is not None:
+                matches = [(distance, image_digest) for distance, image_digest in matches if color_distance(color_signature, self._colors[image_digest]) <= max_color_distance]
+        return matches
+
+    def nearest(self, image_hash: int, max_distance: int, color_signature: Optional[np.ndarray] = None, max_color_distance: float = DEFAULT_MAX_COLOR_DISTANCE) -> Optional[tuple]:
+        matches = self.search(image_hash, max_distance, color_signature, max_color_distance)
+        return matches[0] if matches else None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "max_entries": self.max_entries}
@@ -0,0 +1,107 @@
+from result_cache import LRUCache
+
+# Per-image placeholders when a pipeline stage ran without that Vision feature.
+NOT_AVAILABLE = "Not available, assess directly from the image"
+
+RESPONSE_FORMAT = """
+        **3. Response Format (Strict JSON only):**
+        Return a single JSON object with the following structure. Do not include any text outside of this JSON object.
+        {
+          "scorecard": {
+            "brand_alignment": {"score": <0-1>, "feedback": "<detailed feedback on logo, color, and tone>"},
+            "visual_quality": {"score": <0-1>, "feedback": "<detailed feedback on composition, clarity, and professionalism>"},
+            "message_clarity": {"score": <0-1>, "feedback": "<detailed feedback on the ad's message and call-to-action>"},
+            "safety_ethics": {"score": <0-1>, "feedback": "<detailed feedback based on the Vision API safety analysis and brand rules>"},
+            "overall_score": <0-1>,
+            "strengths": ["<list of 2-3 strengths>"],
+            "what_to_improve": ["<list of 3-5 specific, actionable improvements>"]
+          },
+          "refinement_plan": "<The new, detailed, and improved prompt for the image generation model.>"
+        }
+        """
+
+
+def compile_brand_prefix(brand_kit: dict) -> str:
+    """
+    The static part of the critique prompt for a brand: role, brand guidelines, task and
+    response format. It depends only on the brand kit, so it is identical for every image.
+    """
+    brand_name = brand_kit.get("brand_name", "Unknown")
+    return f"""
+        You are a Creative Director and Brand Compliance Officer for '{brand_name}'.
+        Your task is to analyze the provided advertisement image based on the brand guidelines and a pre-analysis from the Google Vision API, which follows the image.
+
+        **1. Brand Guidelines:**
+        - Brand Name: {brand_name}
+        - Official Color Palette (HEX): {", ".join(brand_kit.get("color_palette_hex", []))}
+        - Tone of Voice Keywords: {", ".join(brand_kit.get("tone_of_voice_keywords", []))}
+        - Official Taglines: {", ".join(brand_kit.get("taglines", []))}
+        - Safety Rules: {" ".join(brand_kit.get("safety_rules", []))}
+
+        **2. Your Task:**
+        Based on all the information provided, analyze the ad image and provide a detailed critique.
+        Evaluate the ad across four dimensions: Brand Alignment, Visual Quality, Message Clarity, and Safety & Ethics.
+        After the critique, generate a new, improved prompt for an image generation model (like Imagen) that would create a better version of this ad, addressing the weaknesses you identified.
+        """ + RESPONSE_FORMAT
+
+
+def describe_palette_compliance(compliance: dict) -> str:
+    """One-line summary of a palette compliance result, for the prompt and the scorecard feedback."""
+    matched = ", ".join(f"{c['hex']}: {c['percent']:.0%}" for c in compliance["colors"])
+    return f"{compliance['score']:.0%} of pixels are within Delta-E {compliance['delta_e_threshold']:g} of the official palette ({matched})"
+
+
+def render_image_analysis(vision_analysis: dict) -> str:
+    """The per-image part of the critique prompt: the Vision pre-analysis and the measured palette compliance."""
+    compliance = vision_analysis.get("palette_compliance")
+    return f"""
+        **Google Vision API Pre-Analysis:**
+        - Detected Logo: {vision_analysis.get('detected_logo') or 'None'}
+        - Dominant Colors Found: {[c['hex'] for c in vision_analysis.get('dominant_colors', [])] or NOT_AVAILABLE}
+        - Palette Compliance (measured, use it when scoring color in Brand Alignment): {describe_palette_compliance(compliance) if compliance else NOT_AVAILABLE}
+        - Safety Analysis: {vision_analysis.get('safety_ratings') or NOT_AVAILABLE}
+        """
+
+
+class BrandPrompt:
+    """
+    Critique prompt for one version of a brand kit: the compiled static prefix plus the
+    per-image renderer. Requests are laid out as [prefix, image, image analysis] so the
+    prefix is a stable leading block that Gemini context caching can reuse.
+    """
+
+    __slots__ = ("brand_key", "kit_hash", "prefix")
+
+    def __init__(self, brand_key: str, kit_hash: str, brand_kit: dict):
+        self.brand_key = brand_key
+        self.kit_hash = kit_hash
+        self.prefix = compile_brand_prefix(brand_kit)
+
+    def contents(self, image_part, vision_analysis: dict) -> list:
+        """The generate_content contents for one image, prefix included."""
+        return [self.prefix, *self.image_contents(image_part, vision_analysis)]
+
+    def image_contents(self, image_part, vision_analysis: dict) -> list:
+        """The per-image contents alone, for a model that already holds the prefix in a context cache."""
+        return [image_part, render_image_analysis(vision_analysis)]
+
+
+class BrandPromptCompiler:
+    """
+    Compiles each brand kit's prompt once and reuses it until the kit changes. Entries are
+    keyed by the kit's content hash, so an edited kit compiles afresh on next use and the
+    stale version ages out of the LRU.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self._compiled = LRUCache(max_entries=max_entries)
+
+    def get(self, brand_key: str, brand_kit: dict, kit_hash: str) -> BrandPrompt:
+        prompt = self._compiled.get(kit_hash)
+        if prompt is None:
+            prompt = BrandPrompt(brand_key, kit_hash, brand_kit)
+            self._compiled.set(kit_hash, prompt)
+        return prompt
+
+    def __len__(self):
+        return len(self._compiled)
@@ -60,7 +60,7 @@ document.addEventListener('DOMContentLoaded', () => {
         showLoadingState();
 
         try {
-            const response = await fetch('/evaluate', { // <-- 1. Call /evaluate
+            const response = await fetch('/evaluate/stream', { // <-- 1. Call /evaluate/stream
                 method: 'POST',
                 body: formData,
             });
@@ -70,7 +70,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 throw new Error(errorData.detail || `HTTP error! Status: ${response.status}`);
             }
 
-            const data = await response.json();
+            const data = await readEvaluationStream(response);
             displayCritiqueResults(data); // <-- 2. Display critique, not final results
 
         } catch (error) {
@@ -79,6 +79,53 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     });
 
+    // Read Server-Sent Events from /evaluate/stream, showing progress as each stage completes.
+    // Resolves with the final evaluation payload from the "complete" event.
+    async function readEvaluationStream(response) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let critiqueLength = 0;
+
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                let eventName = 'message';
+                let eventData = '';
+                rawEvent.split('\n').forEach(line => {
+                    if (line.startsWith('event: ')) eventName = line.slice(7);
+                    else if (line.startsWith('data: ')) eventData += line.slice(6);
+                });
+                const payload = eventData ? JSON.parse(eventData) : null;
+
+                if (eventName === 'vision_analysis') {
+                    updateLoaderText('Image analyzed. Identifying brand...');
+                } else if (eventName === 'brand_detected') {
+                    updateLoaderText(`Brand detected: ${payload.brand_name}. Writing critique...`);
+                } else if (eventName === 'critique_chunk') {
+                    critiqueLength += payload.text.length;
+                    updateLoaderText(`Writing critique... (${critiqueLength} characters)`);
+                } else if (eventName === 'complete') {
+                    return payload;
+                } else if (eventName === 'error') {
+                    throw new Error(payload.detail);
+                }
+            }
+        }
+        throw new Error('The evaluation stream ended before the critique was complete.');
+    }
+
+    function updateLoaderText(message) {
+        document.querySelector('#loader .loader-text').textContent = message;
+    }
+
     // Handle regeneration button click
     regenerateButton.addEventListener('click', async () => {
         if (!currentRefinementPlan) {
@@ -124,6 +171,7 @@ document.addEventListener('DOMContentLoaded', () => {
         document.getElementById('results-content').style.display = 'none';
         document.getElementById('images-results-section').style.display = 'none';
         document.getElementById('loader').style.display = 'flex';
+        updateLoaderText('Analyzing... this may take a moment.');
         regenerateButton.style.display = 'none';
     }
 
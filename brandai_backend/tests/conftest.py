@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The backend modules are imported as top-level modules, as when running from brandai_backend/.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
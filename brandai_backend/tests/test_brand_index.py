@@ -0,0 +1,64 @@
+from brand_index import CONTAINED_MATCH_SCORE, EXACT_MATCH_SCORE, BrandIndex
+
+KITS = {
+    "nike": {"brand_name": "Nike", "aliases": ["Nike Inc.", "Nike Swoosh"]},
+    "cocacola": {"brand_name": "Coca-Cola", "aliases": ["Coke"]},
+    "apple": {"brand_name": "Apple", "aliases": ["Apple Inc."]},
+}
+
+
+def test_alias_table_is_compact_and_includes_key_name_and_aliases():
+    index = BrandIndex(KITS)
+
+    assert index.aliases["nike"] == ["nike", "nikeinc", "nikeswoosh"]
+    assert index.aliases["cocacola"] == ["cocacola", "coke"]
+
+
+def test_exact_alias_match():
+    index = BrandIndex(KITS)
+
+    assert index.match("Coke")[0] == {"brand_key": "cocacola", "alias": "coke", "score": EXACT_MATCH_SCORE}
+    assert index.resolve("NIKE, Inc.") == "nike"
+
+
+def test_alias_contained_in_description():
+    index = BrandIndex(KITS)
+
+    best = index.match("The Coca-Cola Company")[0]
+    assert best == {"brand_key": "cocacola", "alias": "cocacola", "score": CONTAINED_MATCH_SCORE}
+
+
+def test_alias_inside_a_longer_word_does_not_match():
+    index = BrandIndex(KITS)
+
+    assert index.match("Pineapple") == []
+    assert index.resolve("Pineapple Express") is None
+
+
+def test_fuzzy_match_and_min_score_rejection():
+    assert BrandIndex(KITS).resolve("Coca Colla") == "cocacola"
+
+    strict = BrandIndex(KITS, min_score=0.95)
+    assert strict.match("Coca Colla") == []
+    assert strict.match("The Coca-Cola Company") == []
+    assert strict.resolve("Coke") == "cocacola"
+
+
+def test_rank_breaks_ties_by_vision_logo_score():
+    index = BrandIndex(KITS)
+    logos = [{"description": "Nike", "score": 0.55}, {"description": "Apple", "score": 0.91}]
+
+    ranked = index.rank(logos)
+    assert [candidate["brand_key"] for candidate in ranked] == ["apple", "nike"]
+    assert ranked[0]["logo_score"] == 0.91
+
+    # A better match still wins over a more confidently detected logo.
+    logos = [{"description": "Nike", "score": 0.55}, {"description": "The Apple Store", "score": 0.91}]
+    assert index.rank(logos)[0]["brand_key"] == "nike"
+
+
+def test_rank_ties_without_logo_scores_keep_brand_kit_order():
+    index = BrandIndex(KITS)
+    logos = [{"description": "Apple"}, {"description": "Nike"}]
+
+    assert [candidate["brand_key"] for candidate in index.rank(logos)] == ["nike", "apple"]
@@ -0,0 +1,90 @@
+import threading
+
+import context_cache
+from context_cache import BrandContextCache, FakeContextCacheBackend
+from prompts import BrandPrompt
+
+KIT = {"brand_name": "Acme", "color_palette_hex": ["#FF0000"]}
+EDITED_KIT = dict(KIT, taglines=["New tagline"])
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+class FakeModel:
+    def generate_content(self, contents, **kwargs):
+        return contents
+
+
+def make_cache(monkeypatch, backend=None):
+    clock = FakeClock()
+    monkeypatch.setattr(context_cache, "time", clock)
+    backend = backend or FakeContextCacheBackend(FakeModel)
+    return BrandContextCache(backend, ttl_seconds=600, refresh_margin_seconds=60), backend, clock
+
+
+def test_create_then_hit(monkeypatch):
+    cache, backend, _ = make_cache(monkeypatch)
+    prompt = BrandPrompt("acme", "hash-1", KIT)
+
+    model = cache.model_for(prompt)
+    assert model is cache.model_for(prompt)
+    assert backend.calls == [("create", "brandai-acme-hash-1")]
+    assert model.generate_content(["image"]) == [prompt.prefix, "image"]
+    assert cache.stats()["hits"] == 1
+
+
+def test_refresh_near_expiry(monkeypatch):
+    cache, backend, clock = make_cache(monkeypatch)
+    prompt = BrandPrompt("acme", "hash-1", KIT)
+    cache.model_for(prompt)
+
+    clock.now += 570
+    assert cache.model_for(prompt) is not None
+    assert backend.calls[-1] == ("refresh", "brandai-acme-hash-1")
+    clock.now += 60
+    cache.model_for(prompt)
+    assert cache.stats()["refreshed"] == 1
+
+
+def test_kit_hash_change_evicts(monkeypatch):
+    cache, backend, _ = make_cache(monkeypatch)
+    cache.model_for(BrandPrompt("acme", "hash-1", KIT))
+
+    edited = BrandPrompt("acme", "hash-2", EDITED_KIT)
+    model = cache.model_for(edited)
+    assert backend.calls[1:] == [("delete", "brandai-acme-hash-1"), ("create", "brandai-acme-hash-2")]
+    assert model.generate_content([])[0] == edited.prefix
+    assert cache.stats()["evicted"] == 1
+
+
+def test_create_does_not_block_other_brands(monkeypatch):
+    started, release = threading.Event(), threading.Event()
+
+    class SlowBackend(FakeContextCacheBackend):
+        def create(self, display_name, prefix, ttl_seconds):
+            if display_name.startswith("brandai-slow-"):
+                started.set()
+                release.wait(5)
+            return super().create(display_name, prefix, ttl_seconds)
+
+    cache, _, _ = make_cache(monkeypatch, SlowBackend(FakeModel))
+    fast = BrandPrompt("fast", "hash-f", KIT)
+    cache.model_for(fast)
+    slow = BrandPrompt("slow", "hash-s", KIT)
+    creator = threading.Thread(target=cache.model_for, args=(slow,))
+    creator.start()
+    try:
+        assert started.wait(5)
+        assert cache.model_for(fast) is not None
+        # The same brand goes inline instead of waiting for the create in flight.
+        assert cache.model_for(slow) is None
+    finally:
+        release.set()
+        creator.join()
+    assert cache.model_for(slow) is not None
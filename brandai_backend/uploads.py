@@ -0,0 +1,72 @@
+import hashlib
+import io
+
+from fastapi import HTTPException, UploadFile
+from starlette.responses import JSONResponse
+
+# Allowance for multipart boundaries, headers and small form fields on top of the file itself.
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+def upload_too_large(limit: int) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"Upload exceeds the maximum allowed size of {limit / (1024 * 1024):.1f} MB.")
+
+
+class UploadSizeLimitMiddleware:
+    """
+    ASGI middleware that bounds request bodies on upload routes. Requests whose
+    Content-Length is over the limit are rejected before any body is read; chunked
+    bodies are counted as they stream in and aborted as soon as they cross the limit.
+    """
+
+    def __init__(self, app, limits: dict):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope.get("path")) if scope["type"] == "http" and scope["method"] == "POST" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            error = upload_too_large(limit)
+            response = JSONResponse(status_code=error.status_code, content={"detail": error.detail})
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise upload_too_large(limit)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+async def read_upload(upload: UploadFile, max_bytes: int, chunk_size: int = 1024 * 1024) -> tuple:
+    """
+    Reads an uploaded file in chunks, hashing it incrementally and failing with 413 as
+    soon as it exceeds max_bytes. Returns (image_bytes, sha256_hex_digest).
+    """
+    if upload.size is not None and upload.size > max_bytes:
+        raise upload_too_large(max_bytes)
+    hasher = hashlib.sha256()
+    buffer = io.BytesIO()
+    total = 0
+    while True:
+        chunk = await upload.read(chunk_size)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > max_bytes:
+            raise upload_too_large(max_bytes)
+        hasher.update(chunk)
+        buffer.write(chunk)
+    return buffer.getvalue(), hasher.hexdigest()
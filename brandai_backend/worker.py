@@ -0,0 +1,36 @@
+"""
+Standalone job worker for BrandAI.
+
+Processes queued /jobs/* requests from the shared JOB_DB_PATH without serving HTTP,
+so job throughput can be scaled separately from the API server:
+
+    JOB_WORKERS=0 python main.py      # API server only
+    python worker.py                  # one or more worker processes
+"""
+import asyncio
+import os
+import signal
+
+import main
+
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", 4))
+
+
+async def run_worker_process():
+    main.start_services()
+    main.start_job_workers(WORKER_CONCURRENCY)
+
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    print("BrandAI worker running. Press Ctrl+C to stop.")
+    await stop.wait()
+
+    print("Stopping BrandAI worker...")
+    await main.stop_job_workers()
+    main.shutdown_services()
+
+
+if __name__ == "__main__":
+    asyncio.run(run_worker_process())